@@ -0,0 +1,131 @@
+"""
+Measures how fast payloads can be generated with the encode path of the
+frame types: encode() from application values (with inverse conversions),
+and pack_raw() from raw values with the precompiled struct only. Also
+checks that all generated payloads decode to the values they were built
+from.
+
+    python -m benchmarks.encode_speed
+"""
+
+import argparse
+import random
+import struct
+import time
+from types import SimpleNamespace
+
+from bluebattery import frametypes
+
+# payloads per switch and frame type: (frame types, index, values per sub-frame)
+CASES = [
+    (
+        frametypes.LiveFrameTypes,
+        (0x00, 0x07),
+        [{"battery_voltage_V": 12.8, "solar_charge_current_A": 4.2, "battery_current_A": -1.5}],
+    ),
+    (
+        frametypes.LiveFrameTypes,
+        (0x00, 0x0A),
+        [
+            {
+                "battery_voltage_V": 12.8,
+                "solar_charge_current_A": 70.123,
+                "battery_current_A": 2.7,
+                "heap_size_bytes": 1024,
+            }
+        ],
+    ),
+    (
+        frametypes.LiveFrameTypes,
+        (0x03, 0x0F),
+        [
+            {
+                "temperature_deg_C": 21.5,
+                "min_temperature_deg_C": -3.2,
+                "max_temperature_deg_C": 30.0,
+                "total_charge_day_Ah": 12.0,
+                "total_discharge_day_Ah": 3.2,
+                "total_external_charge_day_Ah": 0.0,
+            }
+        ],
+    ),
+    (
+        frametypes.LogFrameTypes,
+        (0x02,),
+        [
+            {
+                "day_counter": day,
+                "wall_time": 3600,
+                "avg_battery_voltage_V": 12.5,
+                "avg_solar_current_A": 1.0,
+                "solar_charger_status": "active",
+                "avg_battery_current_A": 1.2,
+                "battery_state_of_charge_A": 0.5,
+                "avg_booster_input_voltage_V": 12.0,
+                "avg_booster_current_A": -1.5,
+            }
+            for day in (5, 6)
+        ],
+    ),
+]
+
+
+def random_raw(packer, rng):
+    """
+    Returns random raw values within the range of each field.
+    """
+    raw = []
+    for field, *_ in packer.plan:
+        if field.struct == "¾":
+            raw.append(rng.getrandbits(24).to_bytes(3, "big"))
+            continue
+        size = struct.calcsize(field.get_struct())
+        if field.struct.islower():
+            raw.append(rng.randrange(-(1 << (size * 8 - 1)), 1 << (size * 8 - 1)))
+        else:
+            raw.append(rng.getrandbits(size * 8))
+    return raw
+
+
+def rate(function, args, duration):
+    count = 0
+    started = time.perf_counter()
+    while True:
+        for _ in range(1000):
+            function(*args)
+        count += 1000
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            return count / elapsed
+
+
+def check(frame_types, index, values):
+    state = SimpleNamespace(max_days_observed=10)
+    payload = frame_types.encode(index, *values)
+    decoded = [frame_values for _, _, frame_values in frame_types.process(state, payload)]
+    for expected, actual in zip(values, decoded):
+        for key, value in expected.items():
+            assert actual[key] == value, f"{index} {key}: {actual[key]!r} != {value!r}"
+
+
+def main(args):
+    rng = random.Random(1)
+    print(f"{'frame':<28} {'bytes':>5} {'encode/s':>12} {'pack_raw/s':>12}")
+    for frame_types, index, values in CASES:
+        check(frame_types, index, values)
+        packer = frame_types.packer(index)
+        raw = random_raw(packer, rng)
+        # random raw payloads must be accepted by the decoder
+        list(frame_types.process(SimpleNamespace(max_days_observed=0), packer.pack_raw(*raw)))
+        encode_rate = rate(frame_types.encode, (index, *values), args.duration)
+        raw_rate = rate(packer.pack_raw, raw, args.duration)
+        name = f"{packer.frame.output_id.split('/')[0]} {bytes(index).hex()}"
+        print(f"{name:<28} {packer.size:>5} {encode_rate:12,.0f} {raw_rate:12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--duration", type=float, default=1.0, help="Seconds to measure each case"
+    )
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+"""
+Benchmark for the stream output: connects many clients with different
+subscriptions to the Unix socket and measures the time spent in the output
+callback (i.e., in the BLE loop) and the delivery to the clients.
+
+    python -m benchmarks.stream_clients --clients 50 --frames 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bluebattery.output.stream import StreamOutput
+
+SUBSCRIPTIONS = [
+    ["live/*"],
+    ["live/measurement"],
+    ["live/measurement:battery_*"],
+    ["live/battery_comp_1:state_of_charge_percent", "live/derived"],
+    ["log/*"],
+]
+
+FRAMES = [
+    (
+        "live/measurement",
+        {"battery_voltage_V": 12.8, "solar_charge_current_A": 1.2, "battery_current_A": -0.4},
+    ),
+    (
+        "live/battery_comp_1",
+        {
+            "battery_charge_Ah": 158.48,
+            "state_of_charge_percent": 83.4,
+            "max_battery_current_day_A": 0.0,
+            "min_battery_current_day_A": -1.1,
+        },
+    ),
+    ("live/info", {"battery_voltage_V": 12.61, "starter_battery_voltage_V": 12.43}),
+]
+
+
+async def client(path, subscriptions, received):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(json.dumps({"subscribe": subscriptions}).encode() + b"\n")
+    await writer.drain()
+    try:
+        while await reader.readline():
+            received[0] += 1
+    except ConnectionError:
+        pass
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    output = StreamOutput(
+        SimpleNamespace(
+            socket=path,
+            websocket_host="127.0.0.1",
+            websocket_port=0,
+            buffer_size=args.buffer_size,
+        )
+    )
+    await output.start()
+
+    received = [0]
+    tasks = [
+        asyncio.create_task(client(path, SUBSCRIPTIONS[i % len(SUBSCRIPTIONS)], received))
+        for i in range(args.clients)
+    ]
+    while len(output.index.clients) < args.clients:
+        await asyncio.sleep(0.01)
+    # let the subscriptions arrive
+    await asyncio.sleep(0.2)
+
+    device = SimpleNamespace(address="FC:45:C3:CA:FF:EE")
+    callback_time = 0.0
+    start = time.perf_counter()
+    for i in range(args.frames):
+        output_id, values = FRAMES[i % len(FRAMES)]
+        t = time.perf_counter()
+        output.callback(device, (None, output_id, values))
+        callback_time += time.perf_counter() - t
+        if i % args.batch == 0:
+            # give the event loop time to send, as the BLE loop would between reads
+            await asyncio.sleep(0)
+    while any(not c.queue.empty() for c in output.index.clients):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+
+    print(f"clients:              {args.clients} ({len(output.index.clients)} still connected)")
+    print(f"frames:               {args.frames}")
+    print(f"callback time/frame:  {callback_time / args.frames * 1e6:.1f} µs")
+    print(f"messages delivered:   {received[0]} ({received[0] / elapsed:.0f}/s)")
+
+    for task in tasks:
+        task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--buffer-size", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=10, help="Frames between event loop yields")
+    asyncio.run(main(parser.parse_args()))
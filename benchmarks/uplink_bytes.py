@@ -0,0 +1,83 @@
+"""
+Compares the bytes on the wire per frame for the MQTT text topics (mqtt
+output) and the binary uplink format (binary output), using live and log
+payloads from the fake device of the soak test. Also checks that the
+decoder returns the same frames as the normal parsing.
+
+    python -m benchmarks.uplink_bytes
+"""
+
+import argparse
+from types import SimpleNamespace
+
+from bluebattery.soak import FakeBlueBattery
+from bluebattery.uplink import SCHEMA_IDS, SCHEMAS, UplinkDecoder, UplinkEncoder
+
+LIVE_UUID = SCHEMAS[2][0]
+LOG_UUID = SCHEMAS[3][0]
+TOPIC = "service/bluebattery/FC:45:C3:CA:FF:EE"
+# MQTT PUBLISH (QoS 0): fixed header (>= 2 bytes) and 2 bytes topic length
+MQTT_OVERHEAD = 4
+
+
+def reads(count, log_every):
+    clock = SimpleNamespace(now=0.0)
+    device = FakeBlueBattery(SimpleNamespace(time=lambda: clock.now), 1.7e9)
+    for i in range(count):
+        clock.now += 0.33
+        if log_every and i % log_every == 0:
+            yield clock.now, LOG_UUID, device.log_payload()
+        else:
+            yield clock.now, LIVE_UUID, device.live_payload()
+
+
+def text_bytes(output_id, values):
+    total = 0
+    for key, value in values.items():
+        topic = f"{TOPIC}/{output_id}/{key}"
+        total += MQTT_OVERHEAD + len(topic) + len(str(value))
+    return total
+
+
+def main(args):
+    samples = list(reads(args.reads, args.log_every))
+
+    # reference: normal parsing, as done by the characteristics
+    state = SimpleNamespace(max_days_observed=0)
+    expected = []
+    for timestamp, uuid, payload in samples:
+        frame_types = SCHEMAS[SCHEMA_IDS[uuid]][1]
+        for _, output_id, values in frame_types.process(state, payload):
+            expected.append((output_id, values))
+    frames = len(expected)
+    text = sum(text_bytes(output_id, values) for output_id, values in expected)
+    print(f"{args.reads} reads, {frames} frames")
+    print(f"{'format':<32} {'bytes/frame':>12}")
+    print(f"{'mqtt text topics':<32} {text / frames:12.1f}")
+
+    for batch_size in (1, 10, 100):
+        for compress in (False, True):
+            encoder = UplinkEncoder(compress)
+            decoder = UplinkDecoder()
+            total = 0
+            decoded = []
+            for i, (timestamp, uuid, payload) in enumerate(samples):
+                encoder.add(uuid, payload, timestamp)
+                if encoder.count >= batch_size or i == len(samples) - 1:
+                    batch = encoder.flush()
+                    total += MQTT_OVERHEAD + len(f"{TOPIC}/uplink") + len(batch)
+                    decoded += [
+                        (output_id, values) for _, output_id, values in decoder.decode(batch)
+                    ]
+            assert decoded == expected, "decoded frames differ from parsed frames"
+            name = f"binary, batch {batch_size}" + (", zlib" if compress else "")
+            print(f"{name:<32} {total / frames:12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reads", type=int, default=10000)
+    parser.add_argument(
+        "--log-every", type=int, default=50, help="Every Nth read is a log read; 0 for none"
+    )
+    main(parser.parse_args())
@@ -1,12 +1,109 @@
 import asyncio 
+import time
 from concurrent.futures import CancelledError
 
 from . import frametypes
-from .commands import BBFrameTypeSwitch
-from hummable.characteristics import ReadPeriodicCharacteristic
+from .cache import PayloadCache
+from .polling import AdaptivePollingPolicy
+from .scheduler import PRIORITY_LIVE, PRIORITY_LOG, PRIORITY_SEC
+from .trace import tracer
+from hummable.characteristics import Characteristic, ReadPeriodicCharacteristic
 
 
-class BCLog(ReadPeriodicCharacteristic):
+class BBCharacteristic(ReadPeriodicCharacteristic):
+    """
+    Base class for the BlueBattery characteristics. With `start=False`, no
+    periodic read task is created and reads are triggered from outside using
+    `read_once` (used for duty-cycled connections, where the characteristic
+    objects outlive a single connection).
+
+    If `raw_callback` is set, it is called with the UUID and the raw
+    payload of every read, before decoding.
+
+    Decoded frames are cached by raw payload in a PayloadCache of CACHE_SIZE
+    entries (0 disables the cache), so that identical payloads are not
+    parsed again.
+    """
+
+    FRAMES = None  # BBFrame or BBFrameTypeSwitch used to decode the payload
+    CACHE_SIZE = 0
+    CACHE_POLICY = "lru"
+    raw_callback = None
+
+    def __init__(self, client, log, output_callback, start=True):
+        self.cache = PayloadCache(self.CACHE_SIZE, self.CACHE_POLICY)
+        if start:
+            super().__init__(client, log, output_callback)
+        else:
+            Characteristic.__init__(self, client, log, output_callback)
+            self.task = None
+        self.last_read = None
+
+    def due(self, now):
+        """
+        Returns True if the characteristic should be read again at (loop) time `now`.
+        """
+        return self.last_read is None or now - self.last_read >= self.PERIOD
+
+    async def read_periodically(self):
+        # same as ReadPeriodicCharacteristic.read_periodically, but with sampled debug output
+        self.log.debug(f"Starting periodic read of {self.UUID}")
+        try:
+            while True:
+                await self.read_once()
+                await asyncio.sleep(self.PERIOD)
+        except CancelledError:
+            self.log.debug("Task cancelled")
+        except Exception as e:
+            self.log.exception("Error reading characteristic")
+            raise
+
+    async def read_once(self):
+        data = await self.client.read_gatt_char(self.UUID)
+        sampled = tracer.raw(self.log, self.UUID, data)
+        if self.raw_callback:
+            self.raw_callback(self.UUID, data)
+        for frame in self.parse(data):
+            if sampled:
+                self.log.debug("Parsed frame: %s", frame)
+            self.output_callback(frame)
+        self.last_read = asyncio.get_running_loop().time()
+
+    def parse(self, data):
+        frames, _ = self.decode(data)
+        yield from frames
+
+    def decode(self, data):
+        """
+        Decodes a payload into a list of frames, using the cache if possible.
+        Returns the frames and whether they were taken from the cache.
+
+        For cached frames, the postprocess functions of the frames are run
+        again so that side effects on the characteristic (e.g., setting
+        max_days_observed) and values derived from them (e.g., days_ago of
+        extended log entries) are the same as for a fresh decode. Each call
+        returns new value dicts, so consumers may modify them.
+        """
+        key = bytes(data)
+        cached = self.cache.get(key)
+        if cached is None:
+            frames = list(self.FRAMES.process(self, data))
+            self.cache.put(
+                key, [(frame, output_id, dict(values)) for frame, output_id, values in frames]
+            )
+            return frames, False
+
+        frames = []
+        for frame, output_id, values in cached:
+            values = dict(values)
+            if frame is not None and frame.postprocess:
+                frame.postprocess(self, values)
+                output_id = frame.format_output_id(values)
+            frames.append((frame, output_id, values))
+        return frames, True
+
+
+class BCLog(BBCharacteristic):
     """
     This characteristic is used to read the log entries from the battery computer.
     Each read access auto increments the day counter until current day is reach, then it wraps around.
@@ -20,6 +117,21 @@ class BCLog(ReadPeriodicCharacteristic):
     WAIT_BETWEEN = 60 * 60  # once per hour
     MAX_LOG_FRAMES = 60 * 3  # 60 days, three types of log entries
     INITIAL_WAIT = 30
+    PRIORITY = PRIORITY_LOG
+    SLACK = 5
+    # hold a complete log readout, so that the next readout is served from the cache
+    CACHE_SIZE = MAX_LOG_FRAMES + 20
+    # do not output log frames again that were already output in an earlier readout
+    SUPPRESS_DUPLICATES = False
+
+    FRAMES = frametypes.LogFrameTypes
+
+    def __init__(self, client, log, output_callback, start=True):
+        # output_id: values last output under it, for SUPPRESS_DUPLICATES
+        self.emitted = {}
+        # current day of the device, from the last log entry of type 0x00
+        self.max_days_observed = None
+        super().__init__(client, log, output_callback, start)
 
     async def read_periodically(self):
         self.log.debug(f"Starting periodic read of {self.UUID}")
@@ -27,35 +139,71 @@ class BCLog(ReadPeriodicCharacteristic):
             # wait some time so that sec has been read
             await asyncio.sleep(self.INITIAL_WAIT)
             while True:
-                self.log.debug(f"Starting new readout of logs from {self.UUID}")
-                self.reset_log_info()
-                while True:
-                    # read characteristic
-                    data = await self.client.read_gatt_char(self.UUID)
-                    self.log.debug(f"Read {self.UUID}: {' '.join(f'{b:02x}' for b in data)}")
-
-                    parsed = self.parse(data)
-
-                    wrapped = False
-                    for frame in parsed:
-                        self.log.debug(f"Parsed frame: {frame}")
-                        self.output_callback(frame)
-                        if self.check_log_has_wrapped(frame):
-                            wrapped = True
-                            break
-
-                    if wrapped:
-                        self.log.debug("Log has wrapped, stopping readout")
-                        break
-
-                    # wait a second before continuing reading
-                    await asyncio.sleep(self.PERIOD)
+                await self.read_log()
                 await asyncio.sleep(self.WAIT_BETWEEN)
         except CancelledError:
             self.log.debug("Task cancelled")
         except Exception as e:
             self.log.exception("Error reading characteristic")
 
+    def due(self, now):
+        return self.last_read is None or now - self.last_read >= self.WAIT_BETWEEN
+
+    async def read_log(self, pause=None):
+        """
+        Reads all log entries once, until the log wraps around. Waits `pause`
+        seconds (default: PERIOD) between reads.
+        """
+        self.log.debug(f"Starting new readout of logs from {self.UUID}")
+        self.reset_log_info()
+        # reading sec in between would reset the log read pointer
+        with self.client.holding(PRIORITY_SEC):
+            await self.read_entries(pause)
+        self.last_read = asyncio.get_running_loop().time()
+        self.output_callback((None, "status/cache/log", self.cache.stats()))
+
+    async def read_entries(self, pause):
+        while True:
+            # read characteristic
+            data = await self.client.read_gatt_char(self.UUID)
+            sampled = tracer.raw(self.log, self.UUID, data)
+            if self.raw_callback:
+                self.raw_callback(self.UUID, data)
+
+            parsed, _ = self.decode(data)
+
+            wrapped = False
+            for frame in parsed:
+                if sampled:
+                    self.log.debug("Parsed frame: %s", frame)
+                if not self.is_duplicate(frame):
+                    self.output_callback(frame)
+                if self.check_log_has_wrapped(frame):
+                    wrapped = True
+                    break
+
+            if wrapped:
+                self.log.debug("Log has wrapped, stopping readout")
+                break
+
+            # wait a second before continuing reading
+            await asyncio.sleep(self.PERIOD if pause is None else pause)
+
+    def is_duplicate(self, frame):
+        """
+        Returns True if SUPPRESS_DUPLICATES is set and the frame was already
+        output with the same output_id and values. A cache hit alone is not
+        enough: extended log entries do not contain the current day, so the
+        same payload is output under a different days_ago on the next day.
+        """
+        if not self.SUPPRESS_DUPLICATES:
+            return False
+        _, output_id, values = frame
+        if self.emitted.get(output_id) == values:
+            return True
+        self.emitted[output_id] = values
+        return False
+
     def reset_log_info(self):
         self.log_info = {
             "first_day_seen": None,
@@ -81,20 +229,8 @@ class BCLog(ReadPeriodicCharacteristic):
             return True
         return False
 
-    def parse(self, data):
-        yield from BBFrameTypeSwitch(
-        "36xB",  # 36th byte is the frame type indicator
-        {
-            (0x00,): frametypes.LogEntryDaysFrame,
-            (0x01,): frametypes.LogEntryFrameOld,
-            (0x02,): frametypes.LogEntryFrameNew,
-            (0x03,): frametypes.LogEntryFrameLargeSolarCurrent, ###KS
-        },
-        ).process(self, data)
-
 
-
-class BCSec(ReadPeriodicCharacteristic):
+class BCSec(BBCharacteristic):
     """
     time of day in seconds, after power-up it starts with 0, needs to be set after initial connection to correct time.
     Log entry is generated when seconds reach 86400 (24 Hours) and seconds are reset to 0.
@@ -102,36 +238,46 @@ class BCSec(ReadPeriodicCharacteristic):
 
     UUID = "4b616901-40bd-428b-bf06-698e5e422cd9"
     PERIOD = 10 * 60  # once every 10 minutes
+    PRIORITY = PRIORITY_SEC
+    SLACK = 60
 
-    def parse(self, data):
-        yield from frametypes.SecFrame.process(self, data)
+    FRAMES = frametypes.SecFrame
+
+    @staticmethod
+    def time_payload(timestamp=None):
+        """
+        Returns the payload that sets the device to the local time of day.
+        """
+        now = time.localtime(timestamp)
+        return frametypes.SecFrame.encode(
+            {"time_of_day_s": now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec}
+        )
 
 
-class BCLive(ReadPeriodicCharacteristic):
+class BCLive(BBCharacteristic):
+    """
+    Live data. The poll period adapts to the device state: PERIOD while the
+    battery, solar charger or booster is active, backing off to MAX_PERIOD
+    while everything is idle.
+    """
+
     UUID = "4b616912-40bd-428b-bf06-698e5e422cd9"
     PERIOD = 0.33
+    MAX_PERIOD = 10
+    PRIORITY = PRIORITY_LIVE
+    SLACK = PERIOD
+    # live frames repeat while the device is idle
+    CACHE_SIZE = 32
+
+    FRAMES = frametypes.LiveFrameTypes
+
+    def __init__(self, client, log, output_callback, start=True):
+        self.polling = AdaptivePollingPolicy(self.PERIOD, self.MAX_PERIOD)
+        super().__init__(client, log, output_callback, start)
 
     def parse(self, data):
-        yield from BBFrameTypeSwitch(
-            "BB",  # first two bytes indicate frame type
-            {
-                # byte 0: type
-                # byte 1: length
-                (0x00, 0x07): frametypes.BCLiveMeasurementsFrame,
-                (0x00, 0x09): frametypes.BCLiveMeasurementsFrameExtended,
-                (0x00, 0x0A): frametypes.BCLiveMeasurementsFrameLargeSolarCurrent,
-                (0x01, 0x09): frametypes.BCSolarChargerEBLFrame,
-                (0x01, 0x0B): frametypes.BCSolarChargerStandardFrame,
-                (0x01, 0x0C): frametypes.BCSolarChargerExtendedFrame,
-                (0x01, 0x0F): frametypes.BCSolarChargerLargeSolarCurrent,
-                (0x02, 0x10): frametypes.BCBatteryComputer1Frame,
-                (0x02, 0x11): frametypes.BCBatteryComputer1Frame,
-                (0x03, 0x0F): frametypes.BCBatteryComputer2Frame,
-                (0x04, 0x01): frametypes.BCIntradayLogEntryFrame,
-                (0x04, 0x02): frametypes.BCIntradayLogEntryFrameExtended,
-                (0x05, 0x0A): frametypes.BCBoosterDataFrame,
-                (0x05, 0x0C): frametypes.BCBoosterDataFrameExtended,
-                (0x05, 0x10): frametypes.BCBoosterDataFrameExtendedBBX,
-                (0x05, 0x04): frametypes.BCNoBoosterDataFrame,
-            },
-        ).process(self, data)
+        for frame in super().parse(data):
+            self.polling.update(frame)
+            yield frame
+        # the read loop sleeps for self.PERIOD after all frames have been consumed
+        self.PERIOD = self.polling.next_period()
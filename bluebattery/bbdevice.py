@@ -1,5 +1,14 @@
+import asyncio
+import contextlib
+import time
+
+from bleak import BleakClient, exc
+from bleak.backends.device import BLEDevice as BleakDevice
 from hummable.bledevice import BLEDevice
 from .bbcharacteristics import BCLog, BCLive, BCSec
+from .scheduler import GATTScheduler
+
+FIRMWARE_REVISION_UUID = "00002a26-0000-1000-8000-00805f9b34fb"
 
 
 class BlueBattery(BLEDevice):
@@ -7,3 +16,357 @@ class BlueBattery(BLEDevice):
     PAIRING_REQUIRED = False
 
     CHARACTERISTICS = [BCSec, BCLive, BCLog]
+
+    # Duty-cycled mode: if set, connect only every DUTY_CYCLE_INTERVAL seconds,
+    # read DUTY_CYCLE_LIVE_READS live frames plus any due sec/log data, and
+    # disconnect again.
+    DUTY_CYCLE_INTERVAL = None
+    DUTY_CYCLE_LIVE_READS = 16
+
+    # DeviceCache for addresses, firmware revisions and characteristic handles.
+    # If set, a lost connection is re-established directly, up to
+    # RECONNECT_ATTEMPTS times, before falling back to scanning.
+    DEVICE_CACHE = None
+    RECONNECT_ATTEMPTS = 3
+    RECONNECT_DELAY = 2
+
+    # Called with (device, uuid, payload) for every raw payload read, if set
+    RAW_OUTPUT = None
+
+    # Set the time of day of the device on connect, at most once per
+    # TIME_SYNC_INTERVAL seconds; disabled if 0 or None.
+    TIME_SYNC_INTERVAL = 3600
+    last_time_sync = None
+
+    async def run(self):
+        if self.DUTY_CYCLE_INTERVAL:
+            await self.run_duty_cycled()
+        else:
+            await self.run_continuously()
+
+    async def connect(self, client):
+        if self.PAIRING_REQUIRED:
+            res = await client.pair(protection_level=3)
+            self.log.debug(f"Pairing result: {res!r}")
+
+        if not client.is_connected:
+            self.log.warning("Not connected, exiting")
+            return False
+
+        self.output_callback((None, "status", {"connected": 1}))
+        return True
+
+    def create_characteristic(self, cls, client, output_callback, start=True):
+        characteristic = cls(client, self.log, output_callback, start)
+        if self.RAW_OUTPUT:
+            characteristic.raw_callback = lambda uuid, data: self.RAW_OUTPUT(
+                self.device, uuid, data
+            )
+        return characteristic
+
+    def client_target(self):
+        """
+        Returns what to pass to BleakClient: the scanned device if available,
+        so that bleak does not need to scan for it again, otherwise the
+        address of a device known from the cache.
+        """
+        if isinstance(self.device, BleakDevice):
+            return self.device
+        return self.device.address
+
+    @contextlib.asynccontextmanager
+    async def connected_client(self, use_bleak_cache=False, **kwargs):
+        """
+        Connects a BleakClient to the device. With `use_bleak_cache`, bleak
+        takes the services from its cache instead of running a service
+        discovery, if the device is in there.
+        """
+        client = BleakClient(self.client_target(), **kwargs)
+        await client.connect(dangerous_use_bleak_cache=use_bleak_cache)
+        try:
+            yield client
+        finally:
+            await client.disconnect()
+
+    def use_bleak_cache(self):
+        """
+        Returns True if the service discovery can be skipped on connect,
+        because the handles of the device are cached.
+        """
+        return bool(self.DEVICE_CACHE and self.DEVICE_CACHE.has_handles(self.device.address))
+
+    async def resolve_handles(self, client, services_cached=False):
+        """
+        Returns the firmware revision and the {uuid: handle} mapping of the
+        characteristics of the device, and whether the handles were cached.
+        Cached handles are used if the firmware is unchanged and the handles
+        still point to the expected characteristics; otherwise the handles
+        are resolved from the services of the client and the cache is
+        updated.
+
+        If `services_cached` is set, the services of the client were taken
+        from bleak's cache. They cannot be trusted if the cached handles do
+        not match, so the handles are None in that case and the cache entry
+        is invalidated, so that the next connection discovers the services.
+        """
+        try:
+            firmware = (await client.read_gatt_char(FIRMWARE_REVISION_UUID)).decode(
+                errors="replace"
+            )
+        except exc.BleakError:
+            firmware = None
+
+        if self.DEVICE_CACHE:
+            handles = self.DEVICE_CACHE.handles(self.device.address, firmware)
+            if handles and all(
+                self.handle_matches(client, uuid, handle)
+                for uuid, handle in handles.items()
+            ):
+                return firmware, handles, True
+            if services_cached:
+                self.DEVICE_CACHE.invalidate(self.device.address)
+                return firmware, None, False
+
+        wanted = {c.UUID for c in self.CHARACTERISTICS}
+        handles = {
+            characteristic.uuid: characteristic.handle
+            for service in client.services
+            for characteristic in service.characteristics
+            if characteristic.uuid in wanted
+        }
+        if self.DEVICE_CACHE:
+            self.DEVICE_CACHE.update(self.device.address, self.device.name, firmware, handles)
+        return firmware, handles, False
+
+    async def sync_time(self, client, handles):
+        """
+        Writes the local time of day to BCSec, unless it was set less than
+        TIME_SYNC_INTERVAL seconds ago. The device counts the time of day
+        from 0 after power-up and starts a new log entry at midnight.
+        """
+        if not self.TIME_SYNC_INTERVAL or BCSec.UUID not in handles:
+            return
+        now = time.monotonic()
+        if self.last_time_sync is not None and now - self.last_time_sync < self.TIME_SYNC_INTERVAL:
+            return
+        try:
+            await client.write_gatt_char(handles[BCSec.UUID], BCSec.time_payload(), response=True)
+        except exc.BleakError:
+            self.log.warning("Could not set the time of day", exc_info=True)
+            return
+        self.last_time_sync = now
+        self.log.info("Time of day set")
+
+    @staticmethod
+    def handle_matches(client, uuid, handle):
+        characteristic = client.services.get_characteristic(handle)
+        return characteristic is not None and characteristic.uuid == uuid
+
+    async def run_continuously(self):
+        """
+        Connects to the device and keeps reading. With a DEVICE_CACHE, the
+        connection is re-established directly after it was lost.
+        """
+        failures = 0
+        while True:
+            if await self.read_connected():
+                failures = 0
+            else:
+                failures += 1
+            if not self.DEVICE_CACHE or failures >= self.RECONNECT_ATTEMPTS:
+                return
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            self.log.info("Reconnecting...")
+
+    async def read_connected(self):
+        """
+        Connects to the device and starts all characteristics. In contrast to
+        BLEDevice.run, all GATT operations of the characteristics are routed
+        through one GATTScheduler per connection, and the characteristics are
+        stopped as soon as the connection is lost. The connection setup time
+        and the time until the first frame was received are reported as a
+        `status/connection` frame.
+
+        Returns True if a connection was established.
+        """
+        self.log.info("Starting...")
+        characteristics = []
+        scheduler = None
+        started = time.monotonic()
+        connection_info = {}
+        bleak_cache = self.use_bleak_cache()
+        disconnected = asyncio.Event()
+
+        def disconnected_callback(client):
+            disconnected.set()
+            self.disconnect_callback(client)
+
+        def output_callback(frame):
+            if frame[0] is not None and "time_to_first_frame_s" not in connection_info:
+                connection_info["time_to_first_frame_s"] = time.monotonic() - started
+                self.output_callback((None, "status/connection", dict(connection_info)))
+            self.output_callback(frame)
+
+        try:
+            async with self.connected_client(
+                bleak_cache, disconnected_callback=disconnected_callback
+            ) as client:
+                if not await self.connect(client):
+                    return False
+                connection_info["connect_s"] = time.monotonic() - started
+
+                firmware, handles, cached = await self.resolve_handles(client, bleak_cache)
+                if handles is None:
+                    self.log.info("Cached services are outdated, reconnecting with service discovery")
+                    return True
+                connection_info["firmware"] = firmware
+                connection_info["cached_handles"] = int(cached)
+                await self.sync_time(client, handles)
+
+                scheduler = GATTScheduler(client, self.log, self.output_callback, handles)
+
+                for c in self.CHARACTERISTICS:
+                    if c.UUID in handles:
+                        characteristics.append(
+                            self.create_characteristic(
+                                c, scheduler.client_for(c.PRIORITY, c.SLACK), output_callback
+                            )
+                        )
+                    else:
+                        self.log.warning(f"Characteristic {c.UUID} not available")
+
+                # wait for all tasks of all characteristics to finish, or
+                # for the connection to be lost, whichever comes first
+                lost = asyncio.create_task(disconnected.wait())
+                try:
+                    await asyncio.wait(
+                        [
+                            asyncio.gather(
+                                *[c.task for c in characteristics], return_exceptions=True
+                            ),
+                            lost,
+                        ],
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    lost.cancel()
+            return True
+        except (exc.BleakError, asyncio.TimeoutError):
+            self.log.exception("Error connecting")
+            return "connect_s" in connection_info
+        except asyncio.CancelledError:
+            self.log.info("Cancelled")
+            raise
+        finally:
+            for c in characteristics:
+                c.task.cancel()
+            if scheduler:
+                scheduler.task.cancel()
+            self.output_callback((None, "status", {"connected": 0}))
+
+    async def run_duty_cycled(self):
+        """
+        Connects to the device every DUTY_CYCLE_INTERVAL seconds, reads a
+        burst of data and disconnects again. The characteristic objects are
+        kept between cycles so that their state (log readout, last read times)
+        survives the disconnect. The time spent connected is reported as a
+        `status/duty_cycle` frame after each cycle.
+        """
+        self.log.info(f"Starting duty-cycled mode, interval {self.DUTY_CYCLE_INTERVAL}s")
+        loop = asyncio.get_running_loop()
+        characteristics = {
+            c: self.create_characteristic(c, None, self.output_callback, start=False)
+            for c in self.CHARACTERISTICS
+        }
+        handles = None
+        cycles = 0
+        total_connected = 0.0
+        started = time.monotonic()
+        try:
+            while True:
+                cycle_start = time.monotonic()
+                connected_at = None
+                try:
+                    # the services are known from the first cycle on
+                    async with self.connected_client(handles is not None) as client:
+                        connected_at = time.monotonic()
+                        if await self.connect(client):
+                            if handles is None:
+                                _, handles, _ = await self.resolve_handles(client)
+                            await self.sync_time(client, handles)
+                            await self.read_burst(
+                                client,
+                                handles,
+                                [
+                                    characteristics[c]
+                                    for c in self.CHARACTERISTICS
+                                    if c.UUID in handles
+                                ],
+                                loop.time(),
+                            )
+                except Exception:
+                    # keep cycling, the characteristics keep their state
+                    self.log.exception("Error during duty cycle")
+                finally:
+                    self.output_callback((None, "status", {"connected": 0}))
+
+                cycle_end = time.monotonic()
+                cycles += 1
+                if connected_at:
+                    total_connected += cycle_end - connected_at
+                self.output_callback(
+                    (
+                        None,
+                        "status/duty_cycle",
+                        {
+                            "cycle": cycles,
+                            "connect_s": (connected_at or cycle_end) - cycle_start,
+                            "connected_s": cycle_end - (connected_at or cycle_end),
+                            "duty_ratio": total_connected / (cycle_end - started),
+                        },
+                    )
+                )
+                await asyncio.sleep(
+                    max(0, self.DUTY_CYCLE_INTERVAL - (cycle_end - cycle_start))
+                )
+        except asyncio.CancelledError:
+            self.log.info("Cancelled")
+
+    async def read_burst(self, client, handles, characteristics, now):
+        """
+        Reads the live data burst and all sec/log data that is due. Sec is
+        read before the log, since reading sec resets the log read pointer.
+        The log is read back to back to keep the connection short.
+        """
+        scheduler = GATTScheduler(client, self.log, self.output_callback, handles)
+        try:
+            for c in characteristics:
+                c.client = scheduler.client_for(c.PRIORITY, c.SLACK)
+
+            for c in characteristics:
+                if isinstance(c, BCSec) and c.due(now):
+                    await self.read_guarded(c.read_once())
+
+            for c in characteristics:
+                if isinstance(c, BCLive):
+                    for _ in range(self.DUTY_CYCLE_LIVE_READS):
+                        await self.read_guarded(c.read_once())
+
+            for c in characteristics:
+                if isinstance(c, BCLog) and c.due(now):
+                    await self.read_guarded(c.read_log(pause=0))
+        finally:
+            scheduler.task.cancel()
+
+    async def read_guarded(self, read):
+        """
+        Awaits a read of a characteristic. Errors other than connection
+        errors, e.g., payloads that cannot be decoded, are logged, so that
+        the rest of the burst is still read.
+        """
+        try:
+            await read
+        except (exc.BleakError, asyncio.TimeoutError):
+            raise
+        except Exception:
+            self.log.exception("Error reading characteristic")
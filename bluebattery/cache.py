@@ -0,0 +1,53 @@
+"""
+Bounded cache of decoded frames, keyed by the raw payload read from a characteristic.
+"""
+
+from collections import OrderedDict
+
+
+class PayloadCache:
+    """
+    Maps raw payloads to the frames decoded from them.
+
+    `size` is the maximum number of entries; a size of 0 disables the cache.
+    `policy` selects which entry is evicted when the cache is full: "lru"
+    evicts the least recently used entry, "fifo" the oldest inserted one.
+    """
+
+    POLICIES = ("lru", "fifo")
+
+    def __init__(self, size, policy="lru"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy!r}")
+        self.size = size
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        frames = self.entries.get(key)
+        if frames is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == "lru":
+            self.entries.move_to_end(key)
+        return frames
+
+    def put(self, key, frames):
+        if not self.size:
+            return
+        self.entries[key] = frames
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
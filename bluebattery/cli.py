@@ -6,9 +6,16 @@ import asyncio
 import coloredlogs
 
 from .bbdevice import BlueBattery
+from .bbcharacteristics import BCLive, BCLog
+from .derived import DerivedMetrics
+from .devicecache import DeviceCache
+from .history import History, HistoryServer
+from .trace import tracer
+from .output.binary import BinaryOutput
 from .output.log import LogOutput
 from .output.mqtt import MQTTOutput
-from hummable.scanner import Scanner
+from .output.stream import StreamOutput
+from .scanner import BlueBatteryScanner
 
 
 KNOWN_DEVICES = (BlueBattery,)
@@ -20,6 +27,8 @@ def run():
     subparsers = parser.add_subparsers(dest="output", help="Output")
     LogOutput.add_subparser(subparsers)
     MQTTOutput.add_subparser(subparsers)
+    StreamOutput.add_subparser(subparsers)
+    BinaryOutput.add_subparser(subparsers)
 
     # let user define the log level, default is INFO
 
@@ -29,8 +38,118 @@ def run():
         help="Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)",
     )
 
+    parser.add_argument(
+        "--live-max-period",
+        default=BCLive.MAX_PERIOD,
+        type=float,
+        help=f"Maximum poll period for live data in seconds while the device is idle; "
+        f"set to {BCLive.PERIOD} to disable adaptive polling (default: {BCLive.MAX_PERIOD})",
+    )
+
+    parser.add_argument(
+        "--duty-cycle",
+        default=None,
+        type=float,
+        metavar="SECONDS",
+        help="Do not stay connected; instead connect every SECONDS seconds, "
+        "read a burst of data and disconnect again. While connected this way, "
+        f"scans for new devices run only every {BlueBatteryScanner.DUTY_CYCLE_SCAN_INTERVAL}s "
+        "(default: stay connected)",
+    )
+
+    parser.add_argument(
+        "--duty-cycle-live-reads",
+        default=BlueBattery.DUTY_CYCLE_LIVE_READS,
+        type=int,
+        help=f"Number of live data reads per duty cycle (default: {BlueBattery.DUTY_CYCLE_LIVE_READS})",
+    )
+
+    parser.add_argument(
+        "--derived",
+        action="store_true",
+        help="Additionally output derived metrics (power, energy, time to empty/full) as live/derived",
+    )
+
+    parser.add_argument(
+        "--log-cache-size",
+        default=BCLog.CACHE_SIZE,
+        type=int,
+        help=f"Number of log payloads to cache between log readouts; 0 disables the cache (default: {BCLog.CACHE_SIZE})",
+    )
+
+    parser.add_argument(
+        "--suppress-duplicate-log-frames",
+        action="store_true",
+        help="Do not output log entries again that are unchanged since the last log readout",
+    )
+
+    parser.add_argument(
+        "--history-size",
+        default=0,
+        type=int,
+        help="Keep the last N live frames per device and output in memory and serve them "
+        "via HTTP on the loopback interface; 0 disables the history (default: 0)",
+    )
+
+    parser.add_argument(
+        "--history-port",
+        default=8787,
+        type=int,
+        help="Port of the history HTTP server (default: 8787)",
+    )
+
+    parser.add_argument(
+        "--trace-sample-every",
+        default=tracer.sample_every,
+        type=int,
+        help=f"With log level DEBUG, log only every Nth raw payload and its parsed frames (default: {tracer.sample_every})",
+    )
+
+    parser.add_argument(
+        "--trace-max-per-second",
+        default=tracer.max_per_second,
+        type=float,
+        help=f"With log level DEBUG, log at most this many raw payloads per second; 0 for no limit (default: {tracer.max_per_second})",
+    )
+
+    parser.add_argument(
+        "--trace-records",
+        default=tracer.records,
+        type=int,
+        help=f"Number of raw payloads kept in the trace buffer, which is logged on SIGUSR1; 0 disables the buffer (default: {tracer.records})",
+    )
+
+    parser.add_argument(
+        "--device-cache",
+        default=DeviceCache.DEFAULT_PATH,
+        help=f"File to cache known devices and their characteristic handles in, "
+        f"for fast reconnects; empty to disable (default: {DeviceCache.DEFAULT_PATH})",
+    )
+
+    parser.add_argument(
+        "--time-sync-interval",
+        default=BlueBattery.TIME_SYNC_INTERVAL,
+        type=float,
+        help="Set the time of day of the device on connect, at most once in this many "
+        f"seconds; 0 disables (default: {BlueBattery.TIME_SYNC_INTERVAL})",
+    )
+
     args = parser.parse_args()
 
+    BCLive.MAX_PERIOD = max(args.live_max_period, BCLive.PERIOD)
+    BlueBattery.DUTY_CYCLE_INTERVAL = args.duty_cycle
+    BlueBattery.DUTY_CYCLE_LIVE_READS = args.duty_cycle_live_reads
+    BlueBattery.TIME_SYNC_INTERVAL = args.time_sync_interval
+    if args.device_cache:
+        BlueBattery.DEVICE_CACHE = DeviceCache(args.device_cache)
+    BCLog.CACHE_SIZE = args.log_cache_size
+    BCLog.SUPPRESS_DUPLICATES = args.suppress_duplicate_log_frames
+    if args.trace_sample_every < 1:
+        parser.error("--trace-sample-every must be at least 1")
+    if args.trace_records < 0:
+        parser.error("--trace-records must not be negative")
+    tracer.configure(args.trace_records, args.trace_sample_every, args.trace_max_per_second)
+
     # set log level
     # Set up logging with colored output
     coloredlogs.install(level=args.log_level)
@@ -43,10 +162,26 @@ def run():
         output = LogOutput(args)
     elif args.output == "mqtt":
         output = MQTTOutput(args)
+    elif args.output == "stream":
+        output = StreamOutput(args)
+    elif args.output == "binary":
+        output = BinaryOutput(args)
     else:
         raise ValueError("Please specify an output method.")
 
-    scanner = Scanner(output.callback, KNOWN_DEVICES)
+    if hasattr(output, "raw_callback"):
+        BlueBattery.RAW_OUTPUT = output.raw_callback
+
+    callback = output.callback
+    history = None
+    if args.history_size:
+        history = History(callback, args.history_size)
+        callback = history.callback
+    # outside of History, so that the derived frames are kept in the history
+    if args.derived:
+        callback = DerivedMetrics(callback).callback
+
+    scanner = BlueBatteryScanner(callback, KNOWN_DEVICES)
 
     # default logger
     log = logging.getLogger(__name__)
@@ -55,8 +190,29 @@ def run():
     signal.signal(signal.SIGINT, scanner.shutdown)
     signal.signal(signal.SIGTERM, scanner.shutdown)
 
+    async def main():
+        # run from the event loop, not in between the steps of Tracer.record
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, tracer.dump)
+        if hasattr(output, "start"):
+            await output.start()
+        if history:
+            await HistoryServer(history, port=args.history_port).start()
+        if BlueBattery.DEVICE_CACHE:
+            # connect to known devices right away instead of waiting for the first scan
+            loop = asyncio.get_running_loop()
+            for device in BlueBattery.DEVICE_CACHE.known_devices():
+                log.info(f"Connecting to known device {device.name} ({device.address})")
+                scanner.tasks[device.address] = asyncio.create_task(
+                    BlueBattery(device, loop, callback).run()
+                )
+        await scanner.run()
+
     log.info("Started!")
-    asyncio.run(scanner.run())
+    try:
+        asyncio.run(main())
+    finally:
+        if hasattr(output, "close"):
+            output.close()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
 import logging
+import re
 import struct
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import partial
 from typing import Callable, Dict, List, Optional, Tuple, Union
 
 BYTE_ORDER = ">"  # > big-endian, < little-endian
@@ -18,11 +20,15 @@ class BBValue:
 
     Additionally implements ¾ as a special struct character for 24-bit signed
     integers; works only on the leftmost place in the string.
+
+    For encoding, conversion_fn is inverted by inverse_fn, or else by the
+    `inverse` attribute of the conversion function (see conversions).
     """
 
     struct: str
     output_id: str
     conversion_fn: Optional[Callable] = None
+    inverse_fn: Optional[Callable] = None
 
     def value(self, raw_value: Union[bytes, int, float]) -> Union[int, float, str]:
         """Converts a raw_value resulting from unpacking a struct into a value usable for an application.
@@ -47,6 +53,26 @@ class BBValue:
         else:
             return self.conversion_fn(raw_value)
 
+    def raw(self, value: Union[int, float, str]) -> Union[bytes, int, float]:
+        """Converts a value as returned by value() back into a raw value for struct.pack.
+
+        Args:
+            value (Union[int, float, str]): Application value
+
+        Returns:
+            Union[bytes, int, float]: Raw value
+        """
+        if self.conversion_fn:
+            inverse_fn = self.inverse_fn or getattr(self.conversion_fn, "inverse", None)
+            if inverse_fn is None:
+                raise ValueError(f"No inverse conversion for {self.output_id}")
+            value = inverse_fn(value)
+        if self.struct == "¾":
+            if not -0x800000 <= value <= 0xFFFFFF:
+                raise struct.error(f"{self.output_id} out of 24-bit range: {value}")
+            return (value & 0xFFFFFF).to_bytes(3, "big")
+        return value
+
     def get_struct(self):
         if not self.struct == "¾":
             return self.struct
@@ -68,10 +94,32 @@ class BBFrame:
     fields: List[BBValue]
     postprocess: Optional[Callable] = None
     preprocess: Optional[Callable] = None
+    # used if a placeholder of output_id is not in the output values
+    fallback_output_id: Optional[str] = None
+    _packer: Optional["BBFramePacker"] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def format(self):
         return BYTE_ORDER + "".join(field.get_struct() for field in self.fields)
 
+    def packer(self) -> "BBFramePacker":
+        if self._packer is None:
+            self._packer = BBFramePacker(self)
+        return self._packer
+
+    def encode(self, *values: Dict) -> bytes:
+        """Packs values (one dict per sub-frame) into a payload; inverse of process()."""
+        return self.packer().encode(*values)
+
+    def format_output_id(self, output):
+        try:
+            return self.output_id.format(**output)
+        except KeyError:
+            if self.fallback_output_id is None:
+                raise
+            return self.fallback_output_id.format(**output)
+
     def process(self, characteristic, value):
 
         non_ignore_fields = filter(
@@ -90,30 +138,144 @@ class BBFrame:
         continue with the rest of the frame.
         """
         output = {}
+        seen = set()  # field names of the current sub-frame
 
         for field, raw_value in raw_values:
             # existing field name indicates: begin of new sub-frame! emit old frame first
-            if field.output_id in output:
+            if field.output_id in seen:
                 if self.postprocess:
                     self.postprocess(characteristic, output)
-                yield (self, self.output_id.format(**output), output)
+                # emit a copy, the dict is reused for the next sub-frame
+                yield (self, self.format_output_id(output), dict(output))
+                seen = set()
+            seen.add(field.output_id)
             # existing field value will be overwritten as necessary
             output[field.output_id] = field.value(raw_value)
 
         if self.postprocess:
             self.postprocess(characteristic, output)
-        yield (self, self.output_id.format(**output), output)
+        yield (self, self.format_output_id(output), output)
 
 
 @dataclass
 class BBFrameTypeSwitch:
     index_byte: str
     frame_types: Dict[Tuple[int, ...], BBFrame]
+    _packers: Dict[Tuple[int, ...], "BBFramePacker"] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def process(self, characteristic, value):
         index_value = struct.unpack_from(BYTE_ORDER + self.index_byte, value)
         if index_value not in self.frame_types:
             raise Exception(f"Frame type not found: {index_value!r}")
-        log.debug(f"Selected index: {index_value}.")
+        log.debug("Selected index: %s.", index_value)
 
         yield from self.frame_types[index_value].process(characteristic, value)
+
+    def packer(self, index_value: Tuple[int, ...]) -> "BBFramePacker":
+        if index_value not in self._packers:
+            if index_value not in self.frame_types:
+                raise Exception(f"Frame type not found: {index_value!r}")
+            self._packers[index_value] = BBFramePacker(
+                self.frame_types[index_value], self.index_byte, index_value
+            )
+        return self._packers[index_value]
+
+    def encode(self, index_value: Tuple[int, ...], *values: Dict) -> bytes:
+        """Packs values into a payload of the given frame type, including the index bytes."""
+        return self.packer(index_value).encode(*values)
+
+
+class BBFramePacker:
+    """
+    Precompiled encoder for a BBFrame.
+
+    encode() converts the values back into raw values and packs them. Fields
+    whose name repeats start a new sub-frame, except in frames with a
+    preprocess function (accumulateSameFieldNames), where they carry the
+    more significant bits of the first field of that name.
+
+    pack_raw() packs raw values (in field order, without ignored fields)
+    directly with the precompiled struct; use it to produce payloads at
+    speed. Ignored bytes are zero, except for the index bytes of a frame
+    type switch, which are filled in.
+    """
+
+    def __init__(self, frame: BBFrame, index_byte: str = "", index_value: Tuple[int, ...] = ()):
+        self.frame = frame
+        index_format = re.sub(r"^\d*x", "", index_byte)
+        index_offset = struct.calcsize(BYTE_ORDER + index_byte) - struct.calcsize(
+            BYTE_ORDER + index_format
+        )
+        index_size = struct.calcsize(BYTE_ORDER + index_format)
+
+        fmt = BYTE_ORDER
+        offset = 0
+        index_position = 0  # position of the index values in the struct arguments
+        fields = []
+        for field in frame.fields:
+            size = struct.calcsize(BYTE_ORDER + field.get_struct())
+            if type(field) is not BBValueIgnore:
+                fields.append(field)
+                fmt += field.get_struct()
+            elif index_value and offset <= index_offset < offset + size:
+                # place the index bytes within the ignored bytes
+                before = index_offset - offset
+                after = size - before - index_size
+                if after < 0:
+                    raise Exception(f"Index bytes overlap fields of {frame.output_id}")
+                fmt += f"{before}x{index_format}{after}x"
+                index_position = len(fields)
+            else:
+                fmt += field.get_struct()
+            offset += size
+
+        # (field, sub-frame, shift, mask); shift is None unless the field is
+        # split, mask is None for the most significant part
+        self.plan = []
+        names = [field.output_id for field in fields]
+        shifts = {}  # output_id: bits of the fields of that name so far
+        for i, field in enumerate(fields):
+            if frame.preprocess and names.count(field.output_id) > 1:
+                bits = struct.calcsize(BYTE_ORDER + field.get_struct()) * 8
+                shift = shifts.get(field.output_id, 0)
+                shifts[field.output_id] = shift + bits
+                mask = (1 << bits) - 1 if field.output_id in names[i + 1 :] else None
+                self.plan.append((field, 0, shift, mask))
+            else:
+                self.plan.append((field, names[:i].count(field.output_id), None, None))
+
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.index_value = index_value
+        self.index_position = index_position
+        if not index_value:
+            self.pack_raw = self.struct.pack
+        elif not index_position:
+            self.pack_raw = partial(self.struct.pack, *index_value)
+        else:
+            pack = self.struct.pack
+            self.pack_raw = lambda *raw: pack(
+                *raw[:index_position], *index_value, *raw[index_position:]
+            )
+
+    def raw_values(self, *values: Dict) -> List:
+        raw = []
+        totals = {}
+        for field, sub_frame, shift, mask in self.plan:
+            if shift is None:
+                raw.append(field.raw(values[sub_frame][field.output_id]))
+                continue
+            if not shift:
+                totals[field.output_id] = field.raw(values[0][field.output_id])
+            part = totals[field.output_id] >> shift
+            if mask is not None:
+                part &= mask
+            raw.append(field.raw(part << shift) if shift else part)
+        return raw
+
+    def encode(self, *values: Dict) -> bytes:
+        raw = self.raw_values(*values)
+        raw[self.index_position : self.index_position] = self.index_value
+        return self.struct.pack(*raw)
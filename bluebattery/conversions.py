@@ -43,4 +43,71 @@ def cnv_charger_phase(phase):
 		1: "absorption",
 		2: "float",
 		3: "care"
-	}.get(phase & 0x0f, "unknown")
\ No newline at end of file
+	}.get(phase & 0x0f, "unknown")
+
+
+def cnv_2s_to_s(_2s):
+    return _2s * 2
+
+
+def cnv_permille_to_percent(permille):
+    return permille / 10
+
+
+def cnv_95_percent_W_to_W(W):
+    # solar power, reported with 95% efficiency
+    return W / 0.95
+
+
+def cnv_32_225mAh_to_Ah(_32_225mAh):
+    return (_32_225mAh * (32 / 225)) / 1000
+
+
+def cnv_256_18000Ah_to_Ah(_256_18000Ah):
+    return _256_18000Ah * (256 / 18000)
+
+
+def cnv_msb_16(msb):
+    return msb << 16
+
+
+"""
+Inverse conversions, used when encoding values into payloads. They are
+attached to the conversion functions as `inverse`; conversions without one
+(e.g., flags) need an explicit `inverse_fn` on the BBValue.
+"""
+
+
+def _scale_inverse(factor):
+    return lambda value: round(value * factor)
+
+
+cnv_mV_to_V.inverse = _scale_inverse(1000)
+cnv_10mV_to_V.inverse = _scale_inverse(100)
+cnv_10mAh_to_Ah.inverse = _scale_inverse(100)
+cnv_mA_to_A.inverse = _scale_inverse(1000)
+cnv_8mA_to_A.inverse = _scale_inverse(125)
+cnv_100mA_to_A.inverse = _scale_inverse(10)
+cnv_neg_100mA_to_A.inverse = _scale_inverse(-10)
+cnv_bb_temp_to_deg_c.inverse = lambda deg_c: round(deg_c * 100) + 0x8000
+cnv_2s_to_s.inverse = lambda s: s // 2
+cnv_permille_to_percent.inverse = _scale_inverse(10)
+cnv_95_percent_W_to_W.inverse = _scale_inverse(0.95)
+cnv_32_225mAh_to_Ah.inverse = _scale_inverse(1000 * 225 / 32)
+cnv_256_18000Ah_to_Ah.inverse = _scale_inverse(18000 / 256)
+cnv_msb_16.inverse = lambda value: value >> 16
+
+
+def _lookup_inverse(names):
+    def inverse(name):
+        if name not in names:
+            raise ValueError(f"Cannot encode {name!r}")
+        return names[name]
+
+    return inverse
+
+
+cnv_solar_status.inverse = _lookup_inverse({"active": 0, "standby": 1, "reduced": 2})
+cnv_charger_phase.inverse = _lookup_inverse(
+    {"bulk": 0, "absorption": 1, "float": 2, "care": 3}
+)
@@ -0,0 +1,140 @@
+"""
+Derived metrics (power, energy, runtime estimates) computed incrementally
+from the live data and emitted as an additional `live/derived` output.
+"""
+
+import math
+import time
+
+
+class DeviceMetrics:
+    """
+    Derived metrics for one device. All updates are O(1) per frame.
+
+    Energy is integrated with the trapezoidal rule between two consecutive
+    measurement frames and reset at local midnight. Integration is skipped if
+    two frames are more than MAX_GAP_S apart. The battery current used for
+    the runtime estimates is smoothed with an exponential moving average
+    with time constant SMOOTHING_S.
+    """
+
+    MAX_GAP_S = 15 * 60
+    SMOOTHING_S = 5 * 60
+    MIN_CURRENT_A = 0.05  # below this, no runtime estimate is given
+
+    def __init__(self):
+        self.day = None
+        self.last_time = None
+        self.last_battery_power = None
+        self.last_solar_power = None
+        self.energy_in_Wh = 0.0
+        self.energy_out_Wh = 0.0
+        self.solar_energy_Wh = 0.0
+        self.smoothed_current = None
+        self.charge_Ah = None
+        self.state_of_charge_percent = None
+
+    def update_battery_state(self, values):
+        self.charge_Ah = values.get("battery_charge_Ah", self.charge_Ah)
+        self.state_of_charge_percent = values.get(
+            "state_of_charge_percent", self.state_of_charge_percent
+        )
+
+    def update_measurement(self, values, timestamp):
+        voltage = values["battery_voltage_V"]
+        current = values["battery_current_A"]
+        battery_power = voltage * current
+        solar_power = voltage * values["solar_charge_current_A"]
+
+        day = time.localtime(timestamp)[:3]
+        if day != self.day:
+            self.day = day
+            self.energy_in_Wh = 0.0
+            self.energy_out_Wh = 0.0
+            self.solar_energy_Wh = 0.0
+
+        if self.last_time is not None and 0 < timestamp - self.last_time <= self.MAX_GAP_S:
+            dt_h = (timestamp - self.last_time) / 3600
+            energy_in, energy_out = self.integrate(
+                self.last_battery_power, battery_power, dt_h
+            )
+            self.energy_in_Wh += energy_in
+            self.energy_out_Wh += energy_out
+            self.solar_energy_Wh += (self.last_solar_power + solar_power) / 2 * dt_h
+
+            alpha = 1 - math.exp(-(timestamp - self.last_time) / self.SMOOTHING_S)
+            self.smoothed_current += alpha * (current - self.smoothed_current)
+        else:
+            self.smoothed_current = current
+
+        self.last_time = timestamp
+        self.last_battery_power = battery_power
+        self.last_solar_power = solar_power
+
+        output = {
+            "battery_power_W": battery_power,
+            "solar_power_W": solar_power,
+            "energy_in_day_Wh": self.energy_in_Wh,
+            "energy_out_day_Wh": self.energy_out_Wh,
+            "solar_energy_day_Wh": self.solar_energy_Wh,
+            "smoothed_battery_current_A": self.smoothed_current,
+        }
+        output.update(self.runtime_estimates())
+        return output
+
+    @staticmethod
+    def integrate(p0, p1, dt_h):
+        """
+        Trapezoidal integration of the power between two samples, split into
+        the charging (positive) and discharging (negative) part. If the sign
+        changes between the samples, the segment is split at the zero crossing.
+        """
+        if (p0 >= 0) == (p1 >= 0):
+            energy = (p0 + p1) / 2 * dt_h
+            return (energy, 0.0) if energy >= 0 else (0.0, -energy)
+        crossing = p0 / (p0 - p1)  # fraction of dt_h until zero crossing
+        first = p0 / 2 * dt_h * crossing
+        second = p1 / 2 * dt_h * (1 - crossing)
+        if first >= 0:
+            return first, -second
+        return second, -first
+
+    def runtime_estimates(self):
+        output = {}
+        if self.charge_Ah is None or abs(self.smoothed_current) < self.MIN_CURRENT_A:
+            return output
+        if self.smoothed_current < 0:
+            output["time_to_empty_h"] = self.charge_Ah / -self.smoothed_current
+        elif self.state_of_charge_percent:
+            capacity_Ah = self.charge_Ah * 100 / self.state_of_charge_percent
+            output["time_to_full_h"] = max(
+                0.0, (capacity_Ah - self.charge_Ah) / self.smoothed_current
+            )
+        return output
+
+
+class DerivedMetrics:
+    """
+    Output stage that passes all frames on to `output_callback` and, for every
+    live measurement frame, additionally emits a `live/derived` frame.
+    """
+
+    def __init__(self, output_callback, clock=time.time):
+        self.output_callback = output_callback
+        self.clock = clock
+        self.devices = {}
+
+    def callback(self, device, data):
+        self.output_callback(device, data)
+
+        _, output_id, values = data
+        if output_id == "live/battery_comp_1":
+            self.metrics_for(device).update_battery_state(values)
+        elif output_id == "live/measurement":
+            derived = self.metrics_for(device).update_measurement(values, self.clock())
+            self.output_callback(device, (None, "live/derived", derived))
+
+    def metrics_for(self, device):
+        if device.address not in self.devices:
+            self.devices[device.address] = DeviceMetrics()
+        return self.devices[device.address]
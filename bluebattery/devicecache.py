@@ -0,0 +1,86 @@
+"""
+Persistent cache of known devices, their firmware revisions and the GATT
+handles of their characteristics.
+
+With the cache, known devices can be connected to directly after a restart
+or disconnect, without waiting for a scan, and the GATT service discovery
+can be skipped when connecting to a device with cached handles.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+# stands in for a scanned bleak device when connecting to a cached address
+KnownDevice = namedtuple("KnownDevice", ["address", "name"])
+
+
+class DeviceCache:
+    DEFAULT_PATH = os.path.join("~", ".cache", "bluebattery", "devices.json")
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = os.path.expanduser(path)
+        self.log = logging.getLogger("devicecache")
+        self.devices = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.devices = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            self.log.warning(f"Ignoring invalid device cache {self.path}")
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.devices, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError:
+            # the in-memory cache is still used
+            self.log.warning(f"Could not save device cache {self.path}", exc_info=True)
+
+    def known_devices(self):
+        return [
+            KnownDevice(address, entry.get("name") or address)
+            for address, entry in self.devices.items()
+        ]
+
+    def has_handles(self, address):
+        entry = self.devices.get(address)
+        return bool(entry and entry.get("handles"))
+
+    def handles(self, address, firmware):
+        """
+        Returns the cached {uuid: handle} mapping for the device, or None if
+        there is no entry or it was recorded with a different firmware.
+        """
+        entry = self.devices.get(address)
+        if entry is None:
+            return None
+        if entry.get("firmware") != firmware:
+            self.log.info(
+                f"Firmware of {address} changed from {entry.get('firmware')} to {firmware}, "
+                "invalidating cached handles"
+            )
+            self.invalidate(address)
+            return None
+        return entry.get("handles")
+
+    def update(self, address, name, firmware, handles):
+        self.devices[address] = {
+            "name": name,
+            "firmware": firmware,
+            "handles": handles,
+            "last_seen": time.time(),
+        }
+        self.save()
+
+    def invalidate(self, address):
+        entry = self.devices.get(address)
+        if entry is not None:
+            entry["handles"] = None
+            self.save()
@@ -3,6 +3,7 @@ from flags import Flags
 from . import conversions as cnv
 from .commands import (
     BBFrame,
+    BBFrameTypeSwitch,
     BBValue,
     BBValueIgnore,
 )
@@ -22,8 +23,12 @@ def add_reverse_day_counter(characteristic, output_values):
     if "max_day_count" in output_values:
         characteristic.max_days_observed = output_values["max_day_count"]
 
+    # extended log entries do not contain the current day, use the one seen
+    # last; before the first entry of type 0x00, days_ago is unknown
+    if characteristic.max_days_observed is None:
+        return
     output_values["days_ago"] = (
-        output_values["max_day_count"] - output_values["day_counter"]
+        characteristic.max_days_observed - output_values["day_counter"]
     )
 
 
@@ -77,11 +82,12 @@ LogEntryDaysFrame = BBFrame(
 # available starting with Version V2xx, not anymore supported starting V306
 LogEntryFrameOld = BBFrame(
     output_id="log/day/-{days_ago}/extended",
+    fallback_output_id="log/day_counter/{day_counter}/extended",
     fields=[
         # bytes 0-1: 16-bit day counter (relative to current day in frame type 0x00)
         BBValue("H", "day_counter"),
         # bytes 2-3: 16-bit wall time in seconds/2
-        BBValue("H", "wall_time", lambda value: value * 2),
+        BBValue("H", "wall_time", cnv.cnv_2s_to_s),
         # bytes 4-5: 16-bit average battery voltage mV
         BBValue("H", "avg_battery_voltage_V", cnv.cnv_mV_to_V),
         # bytes 6-7: 16-bit average solar current mA
@@ -95,7 +101,7 @@ LogEntryFrameOld = BBFrame(
         # bytes 13+ 0-1: 16-bit day counter (relative to current day in frame type 0x00)
         BBValue("H", "day_counter"),
         # bytes 13+ 2-3: 16-bit wall time in seconds/2
-        BBValue("H", "wall_time", lambda value: value * 2),
+        BBValue("H", "wall_time", cnv.cnv_2s_to_s),
         # bytes 13+ 4-5: 16-bit average battery voltage mV
         BBValue("H", "avg_battery_voltage_V", cnv.cnv_mV_to_V),
         # bytes 13+ 6-7: 16-bit average solar current mA
@@ -116,11 +122,12 @@ LogEntryFrameOld = BBFrame(
 
 LogEntryFrameNew = BBFrame(
     output_id="log/day/-{days_ago}/extended",
+    fallback_output_id="log/day_counter/{day_counter}/extended",
     fields=[
         # bytes 0-1: 16-bit day counter (relative to current day in frame type 0x00)
         BBValue("H", "day_counter"),
         # bytes 2-3: 16-bit wall time in seconds/2
-        BBValue("H", "wall_time", lambda value: value * 2),
+        BBValue("H", "wall_time", cnv.cnv_2s_to_s),
         # bytes 4-5: 16-bit average battery voltage mV
         BBValue("H", "avg_battery_voltage_V", cnv.cnv_mV_to_V),
         # bytes 6-7: 16-bit average solar current mA
@@ -138,7 +145,7 @@ LogEntryFrameNew = BBFrame(
         # bytes 17+ 0-1: 16-bit day counter (relative to current day in frame type 0x00)
         BBValue("H", "day_counter"),
         # bytes 17+ 2-3: 16-bit wall time in seconds/2
-        BBValue("H", "wall_time", lambda value: value * 2),
+        BBValue("H", "wall_time", cnv.cnv_2s_to_s),
         # bytes 17+ 4-5: 16-bit average battery voltage mV
         BBValue("H", "avg_battery_voltage_V", cnv.cnv_mV_to_V),
         # bytes 17+ 6-7: 16-bit average solar current mA
@@ -163,11 +170,12 @@ LogEntryFrameNew = BBFrame(
 
 LogEntryFrameLargeSolarCurrent = BBFrame(
     output_id="log/day/-{days_ago}/extended",
+    fallback_output_id="log/day_counter/{day_counter}/extended",
     fields=[
         # bytes 0-1: 16-bit day counter (relative to current day in frame type 0x00)
         BBValue("H", "day_counter"),
         # bytes 2-3: 16-bit wall time in seconds/2
-        BBValue("H", "wall_time", lambda value: value * 2),
+        BBValue("H", "wall_time", cnv.cnv_2s_to_s),
         # bytes 4-5: 16-bit average battery voltage mV
         BBValue("H", "avg_battery_voltage_V", cnv.cnv_mV_to_V),
         # bytes 6-7: 16-bit average solar current mA
@@ -185,7 +193,7 @@ LogEntryFrameLargeSolarCurrent = BBFrame(
         # bytes 17+ 0-1: 16-bit day counter (relative to current day in frame type 0x00)
         BBValue("H", "day_counter"),
         # bytes 17+ 2-3: 16-bit wall time in seconds/2
-        BBValue("H", "wall_time", lambda value: value * 2),
+        BBValue("H", "wall_time", cnv.cnv_2s_to_s),
         # bytes 17+ 4-5: 16-bit average battery voltage mV
         BBValue("H", "avg_battery_voltage_V", cnv.cnv_mV_to_V),
         # bytes 17+ 6-7: 16-bit average solar current mA
@@ -256,7 +264,7 @@ BCLiveMeasurementsFrameLargeSolarCurrent = BBFrame(
     fields=BCLiveMeasurementsFrameExtended.fields
     + [
         # 1 byte MSB solar charge current
-        BBValue("B", "solar_charge_current_A", lambda x : x << 16),
+        BBValue("B", "solar_charge_current_A", cnv.cnv_msb_16),
     ],
     preprocess=accumulateSameFieldNames,
 )
@@ -270,7 +278,7 @@ BCSolarChargerEBLFrame = BBFrame(
         # 2 bytes (09) value Solar max Current per day in mA
         BBValue("H", "max_solar_current_day_A", cnv.cnv_mA_to_A),
         # 2 bytes (10) value Solar max Watt per day in 1W  use 95% efficiency
-        BBValue("H", "max_solar_watt_day_W", lambda value: value / 0.95),
+        BBValue("H", "max_solar_watt_day_W", cnv.cnv_95_percent_W_to_W),
         # 2 bytes (19) value solar charge in 10mAh (*)
         BBValue("H", "solar_charge_day_Ah", cnv.cnv_10mAh_to_Ah),
         # 2 bytes (20) value solar energy in Wh
@@ -314,7 +322,7 @@ BCSolarChargerExtendedFrame = BBFrame(
         #  bit 5: 1:Solar Current
         #  bit 6: 1:Time
         #  bit 7: reserved
-        BBValue("B", "relay_status", RelayStatus),
+        BBValue("B", "relay_status", RelayStatus, int),
     ],
 )
 
@@ -329,9 +337,9 @@ BCSolarChargerLargeSolarCurrent = BBFrame(
         #     3: Care
         BBValue("B", "solar_charger_phase"),# cnv.cnv_charger_phase),
         #1 byte (09) MSB [23:16] solar max current per day (>= V418)
-        BBValue("B", "max_solar_current_day_A", lambda x: x << 16),
+        BBValue("B", "max_solar_current_day_A", cnv.cnv_msb_16),
         #1 byte (19) MSB [23:16] solar charge (>= V418)
-        BBValue("B", "solar_charge_day_Ah", lambda x: x << 16),
+        BBValue("B", "solar_charge_day_Ah", cnv.cnv_msb_16),
     ],
     preprocess=accumulateSameFieldNames,
 )
@@ -345,11 +353,11 @@ BCBatteryComputer1Frame = BBFrame(
         # 2 bytes (01) value Battery Charge in 10mAh (*)
         BBValue("H", "battery_charge_Ah", cnv.cnv_10mAh_to_Ah),
         # 2 bytes (02) value SOC in 0.1% steps
-        BBValue("H", "state_of_charge_percent", lambda x: x / 10),
+        BBValue("H", "state_of_charge_percent", cnv.cnv_permille_to_percent),
         # 2 bytes (03) value Battery max Current per day in 10mA (*)
         BBValue("H", "max_battery_current_day_A", cnv.cnv_10mA_to_A),
         # 2 bytes (04) value Battery min Current per day in 10mA (*)
-        BBValue("H", "min_battery_current_day_A", lambda x: x / -10),
+        BBValue("H", "min_battery_current_day_A", cnv.cnv_neg_100mA_to_A),
         # 2 bytes (05) value Battery max Charge per day in 10mAh
         BBValue("H", "max_battery_charge_day_Ah", cnv.cnv_10mAh_to_Ah),
         # 2 bytes (06) value Battery min Charge per day in 10mAh
@@ -375,13 +383,13 @@ BCBatteryComputer2Frame = BBFrame(
         BBValue("H", "max_temperature_deg_C", cnv.cnv_bb_temp_to_deg_c),
         # 3 bytes (14) value summed total charge per day in 32/225 mAh (*)
         # TODO: unsigned
-        BBValue("¾", "total_charge_day_Ah", lambda x: (x * (32 / 225)) / 1000),
+        BBValue("¾", "total_charge_day_Ah", cnv.cnv_32_225mAh_to_Ah),
         # 3 bytes (15) value summed total discharge per day in 32/225 mAh (*)
         # TODO: unsigned
-        BBValue("¾", "total_discharge_day_Ah", lambda x: (x * (32 / 225)) / 1000),
+        BBValue("¾", "total_discharge_day_Ah", cnv.cnv_32_225mAh_to_Ah),
         # 3 bytes (16) value summed total external charge per in 32/225 mAh (*)
         # TODO: unsigned
-        BBValue("¾", "total_external_charge_day_Ah", lambda x: (x * (32 / 225)) / 1000),
+        BBValue("¾", "total_external_charge_day_Ah", cnv.cnv_32_225mAh_to_Ah),
     ],
 )
 
@@ -427,7 +435,7 @@ BCBoosterDataFrame = BBFrame(
         BBValue("B", "booster_status"),
         # 3 bytes value summed total booster charge per day in 256/18000 Ah
         # TODO: unsigned
-        BBValue("¾", "total_booster_charge_day_Ah", lambda x: x * (256 / 18000)),
+        BBValue("¾", "total_booster_charge_day_Ah", cnv.cnv_256_18000Ah_to_Ah),
     ],
 )
 
@@ -456,3 +464,40 @@ BCBoosterDataFrameExtendedBBX = BBFrame(
 		BBValue("H", "analog_starter_voltage_V", cnv.cnv_mV_to_V),
 	],
 )
+
+
+# Frame types of the log and live characteristics
+
+LogFrameTypes = BBFrameTypeSwitch(
+    "36xB",  # 36th byte is the frame type indicator
+    {
+        (0x00,): LogEntryDaysFrame,
+        (0x01,): LogEntryFrameOld,
+        (0x02,): LogEntryFrameNew,
+        (0x03,): LogEntryFrameLargeSolarCurrent, ###KS
+    },
+)
+
+LiveFrameTypes = BBFrameTypeSwitch(
+    "BB",  # first two bytes indicate frame type
+    {
+        # byte 0: type
+        # byte 1: length
+        (0x00, 0x07): BCLiveMeasurementsFrame,
+        (0x00, 0x09): BCLiveMeasurementsFrameExtended,
+        (0x00, 0x0A): BCLiveMeasurementsFrameLargeSolarCurrent,
+        (0x01, 0x09): BCSolarChargerEBLFrame,
+        (0x01, 0x0B): BCSolarChargerStandardFrame,
+        (0x01, 0x0C): BCSolarChargerExtendedFrame,
+        (0x01, 0x0F): BCSolarChargerLargeSolarCurrent,
+        (0x02, 0x10): BCBatteryComputer1Frame,
+        (0x02, 0x11): BCBatteryComputer1Frame,
+        (0x03, 0x0F): BCBatteryComputer2Frame,
+        (0x04, 0x01): BCIntradayLogEntryFrame,
+        (0x04, 0x02): BCIntradayLogEntryFrameExtended,
+        (0x05, 0x0A): BCBoosterDataFrame,
+        (0x05, 0x0C): BCBoosterDataFrameExtended,
+        (0x05, 0x10): BCBoosterDataFrameExtendedBBX,
+        (0x05, 0x04): BCNoBoosterDataFrame,
+    },
+)
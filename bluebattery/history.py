@@ -0,0 +1,221 @@
+"""
+In-process history of recent live frames, kept in preallocated ring buffers,
+and a small HTTP server on the loopback interface to query it.
+
+Example query for the last 15 minutes of battery voltage and current:
+
+    curl 'http://127.0.0.1:8787/history?device=FC:45:C3:CA:FF:EE&output_id=live/measurement&fields=battery_voltage_V,battery_current_A&since=-900'
+"""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from array import array
+from urllib.parse import parse_qs, urlsplit
+
+
+class RingBuffer:
+    """
+    Fixed-size history of the numeric fields of one output_id of one device.
+
+    Timestamps and each field are stored in preallocated arrays of doubles.
+    The set of fields is taken from the first frame; fields missing in later
+    frames are stored as NaN. Numeric fields that only appear in later frames
+    (e.g., runtime estimates of live/derived) get a column of their own, NaN
+    for the earlier entries.
+    """
+
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.columns = {field: array("d", bytes(8 * capacity)) for field in fields}
+        self.start = 0  # physical index of the oldest entry
+        self.count = 0
+
+    @property
+    def nbytes(self):
+        return self.timestamps.itemsize * self.capacity * (1 + len(self.columns))
+
+    def append(self, timestamp, values):
+        if not self.columns.keys() >= values.keys():
+            for field, value in values.items():
+                if field not in self.columns and is_numeric(value):
+                    self.columns[field] = array("d", [math.nan]) * self.capacity
+        if self.count < self.capacity:
+            position = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            position = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[position] = timestamp
+        for field, column in self.columns.items():
+            value = values.get(field)
+            column[position] = value if is_numeric(value) else math.nan
+
+    def bisect(self, timestamp):
+        """
+        Returns the logical index of the first entry with a timestamp >= `timestamp`.
+        Timestamps are assumed to be appended in increasing order.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[(self.start + middle) % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, since, until, fields):
+        first = self.bisect(since)
+        last = self.bisect(until) if until is not None else self.count
+        positions = [(self.start + i) % self.capacity for i in range(first, last)]
+        output = {"timestamp": [self.timestamps[p] for p in positions]}
+        for field in fields:
+            column = self.columns[field]
+            output[field] = [
+                None if math.isnan(column[p]) else column[p] for p in positions
+            ]
+        return output
+
+
+def is_numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class History:
+    """
+    Output stage that passes all frames on to `output_callback` and records
+    the numeric fields of all live frames in one RingBuffer of `capacity`
+    entries per device and output_id.
+    """
+
+    def __init__(self, output_callback, capacity, clock=time.time):
+        self.output_callback = output_callback
+        self.capacity = capacity
+        self.clock = clock
+        self.buffers = {}
+        self.log = logging.getLogger("history")
+
+    def callback(self, device, data):
+        self.output_callback(device, data)
+
+        _, output_id, values = data
+        if not output_id.startswith("live/"):
+            return
+        key = (device.address, output_id)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            fields = [field for field, value in values.items() if is_numeric(value)]
+            buffer = self.buffers[key] = RingBuffer(self.capacity, fields)
+            self.log.info(
+                f"History for {device.address} {output_id}: {len(fields)} fields, "
+                f"{buffer.nbytes} bytes; total {self.nbytes} bytes"
+            )
+        buffer.append(self.clock(), values)
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers.values())
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "bytes": self.nbytes,
+            "buffers": [
+                {
+                    "device": address,
+                    "output_id": output_id,
+                    "entries": buffer.count,
+                    "fields": list(buffer.columns),
+                    "bytes": buffer.nbytes,
+                }
+                for (address, output_id), buffer in self.buffers.items()
+            ],
+        }
+
+    def query(self, device, output_id, fields=None, since=None, until=None):
+        """
+        Returns the recorded values of `fields` (default: all) between the
+        timestamps `since` and `until`. Negative timestamps are relative to now.
+        """
+        buffer = self.buffers.get((device, output_id))
+        if buffer is None:
+            raise KeyError(f"No history for {device} {output_id}")
+        fields = fields or list(buffer.columns)
+        for field in fields:
+            if field not in buffer.columns:
+                raise KeyError(f"Unknown field: {field}")
+        now = self.clock()
+        since = 0 if since is None else (now + since if since < 0 else since)
+        if until is not None and until < 0:
+            until = now + until
+        return buffer.window(since, until, fields)
+
+
+class HistoryServer:
+    """
+    Minimal HTTP/1.0 server answering GET requests for /history and /stats
+    with JSON. Meant to be bound to the loopback interface only.
+    """
+
+    def __init__(self, history, host="127.0.0.1", port=8787):
+        self.history = history
+        self.host = host
+        self.port = port
+        self.log = logging.getLogger("history.server")
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.log.info(f"Serving history on http://{self.host}:{self.port}/")
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # skip headers
+            while (await reader.readline()).strip():
+                pass
+            status, body = self.respond(request_line.decode("latin-1"))
+            payload = json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, request_line):
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            return "400 Bad Request", {"error": "malformed request"}
+        if method != "GET":
+            return "405 Method Not Allowed", {"error": "only GET is supported"}
+
+        url = urlsplit(target)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/stats":
+            return "200 OK", self.history.stats()
+        if url.path != "/history":
+            return "404 Not Found", {"error": "unknown path"}
+        if "device" not in params or "output_id" not in params:
+            return "400 Bad Request", {"error": "device and output_id are required"}
+
+        try:
+            return "200 OK", self.history.query(
+                params["device"],
+                params["output_id"],
+                params["fields"].split(",") if "fields" in params else None,
+                float(params["since"]) if "since" in params else None,
+                float(params["until"]) if "until" in params else None,
+            )
+        except KeyError as e:
+            return "404 Not Found", {"error": str(e)}
+        except ValueError as e:
+            return "400 Bad Request", {"error": str(e)}
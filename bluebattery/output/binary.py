@@ -0,0 +1,91 @@
+"""
+An MQTT output plugin that publishes the raw payloads in the compact binary
+uplink format (see bluebattery.uplink) instead of one text topic per field.
+"""
+
+import asyncio
+import logging
+import time
+
+from ..uplink import UplinkEncoder
+from .mqtt import MQTTOutput
+
+
+class BinaryOutput(MQTTOutput):
+    @staticmethod
+    def add_subparser(parser):
+        binary_parser = parser.add_parser(
+            "binary", help="MQTT output in a compact binary format"
+        )
+        MQTTOutput.add_arguments(binary_parser)
+        binary_parser.add_argument(
+            "--batch-size",
+            default=20,
+            type=int,
+            help="Number of payloads per published batch (default: 20)",
+        )
+        binary_parser.add_argument(
+            "--batch-interval",
+            default=60,
+            type=float,
+            help="Maximum time in seconds to hold back a payload before its batch "
+            "is published (default: 60)",
+        )
+        binary_parser.add_argument(
+            "--compress",
+            action="store_true",
+            help="Compress batches with zlib",
+        )
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.log = logging.getLogger("output.binary")
+        self.batch_size = args.batch_size
+        self.batch_interval = args.batch_interval
+        self.compress = args.compress
+        self.encoders = {}
+        self.timers = {}  # address: timer handle flushing the pending batch
+
+    def callback(self, device, data):
+        # decoded frames are not sent, only the status frames
+        frame, output_id, output_data = data
+        if output_id == "status" or output_id.startswith("status/"):
+            if output_id == "status" and not output_data.get("connected", 1):
+                self.flush(device.address)
+            super().callback(device, data)
+
+    def raw_callback(self, device, uuid, payload):
+        if device.address not in self.encoders:
+            self.encoders[device.address] = UplinkEncoder(self.compress)
+        encoder = self.encoders[device.address]
+        encoder.add(uuid, payload, time.time())
+        if encoder.count >= self.batch_size:
+            self.flush(device.address)
+        elif device.address not in self.timers:
+            self.timers[device.address] = asyncio.get_running_loop().call_later(
+                self.batch_interval, self.flush, device.address
+            )
+
+    def flush(self, address):
+        """
+        Publishes the pending batch of a device, if any.
+        """
+        timer = self.timers.pop(address, None)
+        if timer:
+            timer.cancel()
+        encoder = self.encoders.get(address)
+        batch = encoder.flush() if encoder else None
+        if batch is None:
+            return
+        topic = f"{self.topic}/{address}/uplink"
+        self.log.debug("Publishing %d bytes to %s", len(batch), topic)
+        self.client.publish(topic, batch, retain=False)
+
+    def close(self):
+        """
+        Publishes all pending batches and disconnects from the broker.
+        """
+        for address in list(self.encoders):
+            self.flush(address)
+        self.client.disconnect()
+        self.client.loop_stop()
@@ -10,4 +10,4 @@ class LogOutput:
 
     def callback(self, device, data):
         frame, output_id, output_data = data
-        self.log.info(f"{device.address} | {output_id}: {output_data}")
+        self.log.info("%s | %s: %s", device.address, output_id, output_data)
@@ -11,6 +11,10 @@ class MQTTOutput:
     @staticmethod
     def add_subparser(parser):
         mqtt_parser = parser.add_parser("mqtt", help="MQTT output")
+        MQTTOutput.add_arguments(mqtt_parser)
+
+    @staticmethod
+    def add_arguments(mqtt_parser):
         mqtt_parser.add_argument(
             "--host",
             default="localhost",
@@ -56,5 +60,5 @@ class MQTTOutput:
             topic = f"{self.topic}/{device.address}/{output_id}/{key}"
             if type(value) not in (str, int, float):
                 value = str(value)
-            self.log.debug(f"Publishing {topic} = {value}")
+            self.log.debug("Publishing %s = %s", topic, value)
             self.client.publish(topic, value, retain=False)
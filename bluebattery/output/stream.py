@@ -0,0 +1,303 @@
+"""
+A streaming output plugin that serves frames to local clients over a Unix
+domain socket (newline-delimited JSON) and a WebSocket.
+
+Clients receive nothing until they subscribe. To subscribe, a client sends a
+JSON message (one per line on the Unix socket, one per text message on the
+WebSocket):
+
+    {"subscribe": ["live/*", "live/measurement:battery_*"]}
+
+Each pattern is an output_id glob, optionally followed by a colon and a
+field glob. `unsubscribe` removes patterns again. Frames are sent as
+
+    {"device": "FC:45:C3:CA:FF:EE", "output_id": "live/measurement", "values": {...}}
+
+Each client has a bounded send buffer. Clients that do not keep up are
+disconnected instead of slowing down the BLE loop.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+from fnmatch import translate
+
+
+class Subscription:
+    def __init__(self, pattern):
+        self.pattern = pattern
+        output_glob, _, field_glob = pattern.partition(":")
+        self.output_id = re.compile(translate(output_glob))
+        self.field = re.compile(translate(field_glob)) if field_glob else None
+
+
+class SubscriptionIndex:
+    """
+    Maps (output_id, field names) to the clients subscribed to them and the
+    fields each client gets. Lookups are cached; the cache is cleared when
+    any subscription changes.
+    """
+
+    def __init__(self):
+        self.clients = set()
+        self.cache = {}
+
+    def add(self, client):
+        self.clients.add(client)
+        self.cache.clear()
+
+    def remove(self, client):
+        self.clients.discard(client)
+        self.cache.clear()
+
+    def changed(self):
+        self.cache.clear()
+
+    def lookup(self, output_id, fields):
+        """
+        Returns a list of (field tuple, clients) for the given output_id, with
+        all clients receiving the same fields grouped together.
+        """
+        key = (output_id, fields)
+        entry = self.cache.get(key)
+        if entry is None:
+            groups = {}
+            for client in self.clients:
+                selected = client.select(output_id, fields)
+                if selected:
+                    groups.setdefault(selected, []).append(client)
+            entry = self.cache[key] = list(groups.items())
+        return entry
+
+
+class StreamClient:
+    def __init__(self, output, reader, writer):
+        self.output = output
+        self.reader = reader
+        self.writer = writer
+        self.subscriptions = {}
+        self.queue = asyncio.Queue(maxsize=output.buffer_size)
+        self.sender = None
+        self.closed = False
+
+    def select(self, output_id, fields):
+        """
+        Returns the tuple of fields this client is subscribed to.
+        """
+        matching = [
+            s for s in self.subscriptions.values() if s.output_id.match(output_id)
+        ]
+        if not matching:
+            return ()
+        if any(s.field is None for s in matching):
+            return fields
+        return tuple(
+            field for field in fields if any(s.field.match(field) for s in matching)
+        )
+
+    def handle_message(self, message):
+        try:
+            request = json.loads(message)
+        except ValueError:
+            self.output.log.warning(f"Invalid message from client: {message!r}")
+            return
+        if not isinstance(request, dict) or not all(
+            isinstance(patterns, list) and all(isinstance(p, str) for p in patterns)
+            for patterns in (request.get("subscribe", []), request.get("unsubscribe", []))
+        ):
+            self.output.log.warning(
+                f"Ignoring message from client, expected lists of patterns: {message!r}"
+            )
+            return
+        for pattern in request.get("subscribe", []):
+            self.subscriptions[pattern] = Subscription(pattern)
+        for pattern in request.get("unsubscribe", []):
+            self.subscriptions.pop(pattern, None)
+        self.output.index.changed()
+
+    def send(self, message):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.output.log.warning("Client too slow, disconnecting")
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.output.index.remove(self)
+            self.writer.close()
+            if self.sender:
+                self.sender.cancel()
+
+    async def run(self):
+        self.output.index.add(self)
+        self.sender = asyncio.create_task(self.send_messages())
+        try:
+            await self.receive_messages()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            self.output.log.debug("Client task cancelled")
+        finally:
+            self.close()
+
+    async def send_messages(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                self.writer.write(self.frame(message))
+                await self.writer.drain()
+        except asyncio.CancelledError:
+            pass
+        except ConnectionError:
+            self.close()
+
+    def frame(self, message):
+        return message + b"\n"
+
+    async def receive_messages(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                # the client closed its sending side, e.g., after subscribing;
+                # keep sending until the connection is closed
+                await asyncio.wait([self.sender])
+                return
+            self.handle_message(line)
+
+
+class WebSocketClient(StreamClient):
+    """
+    Minimal WebSocket (RFC 6455) server side: handshake, unfragmented text
+    messages, ping and close.
+    """
+
+    GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    async def handshake(self):
+        key = None
+        while True:
+            line = await self.reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "sec-websocket-key":
+                key = value.strip().encode()
+        if key is None:
+            self.writer.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(key + self.GUID).digest())
+        self.writer.write(
+            b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+            b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+        return True
+
+    def frame(self, message, opcode=0x1):
+        length = len(message)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        return header + message
+
+    async def receive_messages(self):
+        # request line, then headers
+        await self.reader.readline()
+        if not await self.handshake():
+            return
+        while True:
+            first, second = await self.reader.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack(">H", await self.reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack(">Q", await self.reader.readexactly(8))
+            mask = await self.reader.readexactly(4) if second & 0x80 else bytes(4)
+            payload = await self.reader.readexactly(length)
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:  # close
+                return
+            if opcode == 0x9:  # ping
+                self.writer.write(self.frame(payload, opcode=0xA))
+            elif opcode == 0x1:
+                self.handle_message(payload)
+
+
+class StreamOutput:
+    @staticmethod
+    def add_subparser(parser):
+        stream_parser = parser.add_parser("stream", help="Stream output to local clients")
+        stream_parser.add_argument(
+            "--socket",
+            default="/tmp/bluebattery.sock",
+            help="Path of the Unix domain socket (default: /tmp/bluebattery.sock)",
+        )
+        stream_parser.add_argument(
+            "--websocket-host",
+            default="127.0.0.1",
+            help="WebSocket listen address (default: 127.0.0.1)",
+        )
+        stream_parser.add_argument(
+            "--websocket-port",
+            default=8788,
+            type=int,
+            help="WebSocket port; 0 disables the WebSocket (default: 8788)",
+        )
+        stream_parser.add_argument(
+            "--buffer-size",
+            default=256,
+            type=int,
+            help="Number of frames buffered per client before it is disconnected (default: 256)",
+        )
+
+    def __init__(self, args):
+        self.log = logging.getLogger("output.stream")
+        self.socket_path = args.socket
+        self.websocket_host = args.websocket_host
+        self.websocket_port = args.websocket_port
+        self.buffer_size = args.buffer_size
+        self.index = SubscriptionIndex()
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        await asyncio.start_unix_server(
+            lambda reader, writer: StreamClient(self, reader, writer).run(),
+            self.socket_path,
+        )
+        self.log.info(f"Streaming on {self.socket_path}")
+        if self.websocket_port:
+            await asyncio.start_server(
+                lambda reader, writer: WebSocketClient(self, reader, writer).run(),
+                self.websocket_host,
+                self.websocket_port,
+            )
+            self.log.info(
+                f"Streaming on ws://{self.websocket_host}:{self.websocket_port}/"
+            )
+
+    def callback(self, device, data):
+        frame, output_id, output_data = data
+        for fields, clients in self.index.lookup(output_id, tuple(output_data)):
+            message = json.dumps(
+                {
+                    "device": device.address,
+                    "output_id": output_id,
+                    "values": {field: output_data[field] for field in fields},
+                },
+                default=str,
+            ).encode()
+            for client in clients:
+                client.send(message)
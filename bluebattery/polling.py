@@ -0,0 +1,99 @@
+"""
+Adaptive polling: adjusts the poll period of a characteristic depending on
+the decoded values, so that we poll at full rate while something is happening
+and back off when the device is idle (e.g., at night).
+"""
+
+import time
+
+
+class AdaptivePollingPolicy:
+    """
+    Computes the poll period of a characteristic from the frames read from it.
+
+    Every frame is checked for activity. Any activity resets the period to
+    `min_period` immediately. The device sends a different frame type on each
+    read and most of them carry no activity fields, so the period only backs
+    off after IDLE_READS consecutive reads without activity (at least one
+    full rotation of the frame types). From then on, it is multiplied by
+    `backoff` after each read until `max_period` is reached.
+
+    Activity is:
+     - a battery current above IDLE_CURRENT_A (charging or discharging),
+     - a change of the battery current faster than CURRENT_SLOPE_A_PER_S,
+     - a solar or booster current above IDLE_CURRENT_A,
+     - a change of the solar charger or booster status.
+    """
+
+    IDLE_CURRENT_A = 0.2
+    # two rotations of the four frame types sent by BCLive
+    IDLE_READS = 8
+    CURRENT_SLOPE_A_PER_S = 0.05
+
+    # (output_id, field) pairs for currents that indicate activity when non-zero
+    CURRENT_FIELDS = (
+        ("live/measurement", "battery_current_A"),
+        ("live/measurement", "solar_charge_current_A"),
+        ("live/booster", "booster_charge_current_A"),
+    )
+
+    # fields that indicate activity when they change
+    STATUS_FIELDS = (
+        "solar_charger_status",
+        "booster_status",
+    )
+
+    def __init__(self, min_period, max_period, backoff=1.5, clock=time.monotonic):
+        self.min_period = min_period
+        self.max_period = max_period
+        self.backoff = backoff
+        self.clock = clock
+        self.period = min_period
+        self.last_current = None
+        self.last_status = {}
+        self.active = True
+        self.idle_reads = 0
+
+    def update(self, frame):
+        """
+        Feed a parsed frame (frame, output_id, values) into the policy.
+        """
+        _, output_id, values = frame
+        now = self.clock()
+
+        for current_output_id, field in self.CURRENT_FIELDS:
+            if output_id == current_output_id and field in values:
+                if abs(values[field]) > self.IDLE_CURRENT_A:
+                    self.active = True
+
+        if output_id == "live/measurement" and "battery_current_A" in values:
+            current = values["battery_current_A"]
+            if self.last_current is not None:
+                last_time, last_value = self.last_current
+                if now > last_time:
+                    slope = abs(current - last_value) / (now - last_time)
+                    if slope > self.CURRENT_SLOPE_A_PER_S:
+                        self.active = True
+            self.last_current = (now, current)
+
+        for field in self.STATUS_FIELDS:
+            if field in values:
+                if field in self.last_status and self.last_status[field] != values[field]:
+                    self.active = True
+                self.last_status[field] = values[field]
+
+    def next_period(self):
+        """
+        Returns the period to wait before the next read. Call once per read,
+        after all frames of that read have been passed to `update`.
+        """
+        if self.active:
+            self.idle_reads = 0
+        else:
+            self.idle_reads += 1
+        if self.idle_reads < self.IDLE_READS:
+            self.period = self.min_period
+        else:
+            self.period = min(self.period * self.backoff, self.max_period)
+        self.active = False
+        return self.period
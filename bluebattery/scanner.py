@@ -0,0 +1,43 @@
+"""
+Scanner that scans less often while duty-cycled devices are connected.
+"""
+
+import asyncio
+
+from bleak import exc
+from hummable.scanner import Scanner
+
+from .bbdevice import BlueBattery
+
+
+class BlueBatteryScanner(Scanner):
+    """
+    Like hummable's Scanner, but while a device task in duty-cycled mode is
+    running, scans only every DUTY_CYCLE_SCAN_INTERVAL seconds. A scan keeps
+    the radio busy for several seconds, which would otherwise cancel out
+    most of the savings of the duty cycle.
+    """
+
+    DUTY_CYCLE_SCAN_INTERVAL = 10 * 60
+
+    def scan_interval(self):
+        if BlueBattery.DUTY_CYCLE_INTERVAL and any(
+            not task.done() for task in self.tasks.values()
+        ):
+            return max(self.SCAN_INTERVAL, self.DUTY_CYCLE_SCAN_INTERVAL)
+        return self.SCAN_INTERVAL
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self.log.info("Scanning for devices...")
+                try:
+                    await self.scan_and_connect(loop)
+                except exc.BleakError:
+                    self.log.exception("Error scanning for devices")
+                await asyncio.sleep(self.scan_interval())
+        except asyncio.CancelledError:
+            self.log.info("Stopping scan.")
+            for task in self.tasks.values():
+                task.cancel()
@@ -0,0 +1,219 @@
+"""
+Central scheduler for all GATT operations on one connection.
+
+Characteristics do not talk to the BleakClient directly. Instead, each one
+gets a ScheduledClient that queues its requests with the GATTScheduler of the
+connection. The scheduler runs exactly one request at a time. Requests past
+their deadline run first; the others are ordered by priority class first and
+deadline second, so that live data is not delayed by a running log readout.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import time
+from collections import Counter
+
+PRIORITY_LIVE = 0
+PRIORITY_LOG = 1
+PRIORITY_SEC = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_LIVE: "live",
+    PRIORITY_LOG: "log",
+    PRIORITY_SEC: "sec",
+}
+
+
+class QueueDelayStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.deadline_misses = 0
+
+    def add(self, delay, missed_deadline):
+        self.count += 1
+        self.total_s += delay
+        self.max_s = max(self.max_s, delay)
+        if missed_deadline:
+            self.deadline_misses += 1
+
+    def as_dict(self):
+        return {
+            "requests": self.count,
+            "mean_delay_s": self.total_s / self.count if self.count else 0.0,
+            "max_delay_s": self.max_s,
+            "deadline_misses": self.deadline_misses,
+        }
+
+
+class GATTScheduler:
+    """
+    Owns all GATT operations of one connection. Requests are queued and
+    executed one at a time by a single worker task, see next_request() for
+    the order. Requests of a priority class can be held back, e.g., sec
+    reads during a log readout, since they reset the log read pointer.
+
+    Characteristics given in `handles` are addressed by their GATT handle
+    instead of their UUID, which saves bleak the lookup of the UUID.
+
+    Queueing delay statistics per priority class are emitted as a
+    `status/scheduler` frame every STATS_INTERVAL seconds.
+    """
+
+    STATS_INTERVAL = 60
+
+    def __init__(self, client, log, output_callback, handles=None, clock=time.monotonic):
+        self.client = client
+        # {uuid: handle}; requests for these UUIDs are sent by handle
+        self.handles = handles or {}
+        self.log = log.getChild("scheduler")
+        self.output_callback = output_callback
+        self.clock = clock
+        self.queue = []
+        self.sequence = itertools.count()
+        # {priority: number of holders}; requests of these classes are not run
+        self.held = Counter()
+        self.wakeup = asyncio.Event()
+        self.stats = {priority: QueueDelayStats() for priority in PRIORITY_NAMES}
+        self.last_stats = self.clock()
+        self.task = asyncio.create_task(self.run())
+
+    def client_for(self, priority, slack):
+        """
+        Returns a client-like object for a characteristic. `slack` is the
+        time in seconds a request may wait in the queue before it misses
+        its deadline.
+        """
+        return ScheduledClient(self, priority, slack)
+
+    def submit(self, priority, slack, method, uuid, *args, **kwargs):
+        args = (self.handles.get(uuid, uuid),) + args
+        now = self.clock()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append(
+            (
+                priority,
+                now + slack,
+                next(self.sequence),
+                now,
+                future,
+                method,
+                args,
+                kwargs,
+            ),
+        )
+        self.wakeup.set()
+        return future
+
+    @contextlib.contextmanager
+    def holding(self, priority):
+        """
+        Does not run requests of the given priority class while in the context.
+        """
+        self.held[priority] += 1
+        try:
+            yield
+        finally:
+            self.held[priority] -= 1
+            self.wakeup.set()
+
+    def next_request(self):
+        """
+        Removes and returns the request to run next, or None if no request
+        may run now. Requests past their deadline go first, earliest deadline
+        first, ahead of requests of higher priority classes that still have
+        time. The others are ordered by priority class, then deadline.
+        """
+        now = self.clock()
+        entries = [entry for entry in self.queue if not self.held[entry[0]]]
+        if not entries:
+            return None
+        entry = min(
+            entries,
+            key=lambda entry: (0, entry[1], entry[2])
+            if entry[1] < now
+            else (1, entry[0], entry[1], entry[2]),
+        )
+        self.queue.remove(entry)
+        return entry
+
+    async def run(self):
+        future = None  # request in flight
+        try:
+            while True:
+                entry = self.next_request()
+                if entry is None:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+
+                priority, deadline, _, queued_at, future, method, args, kwargs = entry
+                if future.cancelled():
+                    continue
+
+                started = self.clock()
+                self.stats[priority].add(started - queued_at, started > deadline)
+
+                try:
+                    result = await getattr(self.client, method)(*args, **kwargs)
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+
+                if started - self.last_stats >= self.STATS_INTERVAL:
+                    self.emit_stats()
+        except asyncio.CancelledError:
+            self.log.debug("Scheduler cancelled")
+        finally:
+            if future is not None and not future.done():
+                future.cancel()
+            for entry in self.queue:
+                entry[4].cancel()
+            self.queue.clear()
+
+    def emit_stats(self):
+        output = {}
+        for priority, stats in self.stats.items():
+            for key, value in stats.as_dict().items():
+                output[f"{PRIORITY_NAMES[priority]}_{key}"] = value
+            stats.reset()
+        output["queue_length"] = len(self.queue)
+        self.last_stats = self.clock()
+        self.output_callback((None, "status/scheduler", output))
+
+
+class ScheduledClient:
+    """
+    Stand-in for the BleakClient passed to characteristics. All GATT
+    operations are routed through the scheduler.
+    """
+
+    def __init__(self, scheduler, priority, slack):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.slack = slack
+
+    async def read_gatt_char(self, *args, **kwargs):
+        return await self.scheduler.submit(
+            self.priority, self.slack, "read_gatt_char", *args, **kwargs
+        )
+
+    async def write_gatt_char(self, *args, **kwargs):
+        return await self.scheduler.submit(
+            self.priority, self.slack, "write_gatt_char", *args, **kwargs
+        )
+
+    def holding(self, priority):
+        return self.scheduler.holding(priority)
+
+    @property
+    def is_connected(self):
+        return self.scheduler.client.is_connected
@@ -0,0 +1,333 @@
+"""
+Accelerated soak test: runs the characteristic -> parse -> output pipeline
+against a fake device on an event loop with a virtual clock, so that days of
+operation take minutes. Memory (RSS and tracemalloc) is sampled over time,
+and the run fails if memory keeps growing with the number of frames
+processed.
+
+    python -m bluebattery.soak --days 8
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from . import frametypes
+from .bbcharacteristics import BCLive, BCLog, BCSec
+from .derived import DerivedMetrics
+from .history import History
+from .scheduler import GATTScheduler
+from .trace import tracer
+
+
+class SoakFailure(Exception):
+    pass
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock only advances when all ready callbacks have been
+    run: it then jumps straight to the next scheduled timer. Sleeping tasks
+    therefore do not take any real time. Only suitable for code that does
+    not wait for real I/O.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.virtual_time = 0.0
+
+    def time(self):
+        return self.virtual_time
+
+    def _run_once(self):
+        if not self._ready and self._scheduled:
+            self.virtual_time = max(self.virtual_time, self._scheduled[0]._when)
+        super()._run_once()
+
+
+# packers for the raw payloads of the fake device
+SEC = frametypes.SecFrame.packer()
+LIVE_MEASUREMENT = frametypes.LiveFrameTypes.packer((0x00, 0x07))
+LIVE_SOLAR_CHARGER = frametypes.LiveFrameTypes.packer((0x01, 0x0B))
+LIVE_BATTERY_COMP_1 = frametypes.LiveFrameTypes.packer((0x02, 0x10))
+LIVE_NO_BOOSTER = frametypes.LiveFrameTypes.packer((0x05, 0x04))
+LOG_DAYS = frametypes.LogFrameTypes.packer((0x00,))
+
+
+class FakeBlueBattery:
+    """
+    Client-like fake device producing valid payloads for BCSec, BCLive and
+    BCLog with the frame packers. The values follow a day/night cycle: solar
+    current during the day, a small discharge at night.
+    """
+
+    READ_LATENCY = 0.05
+    LOG_DAYS = 60
+
+    def __init__(self, loop, epoch):
+        self.loop = loop
+        self.epoch = epoch
+        self.live_index = 0
+        self.log_index = 0
+        self.is_connected = True
+
+    def now(self):
+        return self.epoch + self.loop.time()
+
+    async def read_gatt_char(self, uuid):
+        await asyncio.sleep(self.READ_LATENCY)
+        if uuid == BCSec.UUID:
+            return SEC.pack_raw(int(self.now() % 86400))
+        if uuid == BCLive.UUID:
+            return self.live_payload()
+        if uuid == BCLog.UUID:
+            return self.log_payload()
+        raise ValueError(f"Unknown characteristic {uuid}")
+
+    def state(self):
+        hour = (self.now() % 86400) / 3600
+        solar_mA = int(max(0.0, math.sin((hour - 6) / 12 * math.pi)) * 8000)
+        battery_mA = solar_mA - 1500 if solar_mA else -300
+        battery_mV = 12800 + battery_mA // 10
+        return solar_mA, battery_mA, battery_mV
+
+    def live_payload(self):
+        self.live_index += 1
+        solar_mA, battery_mA, battery_mV = self.state()
+        frame_type = self.live_index % 4
+        if frame_type == 0:
+            return LIVE_MEASUREMENT.pack_raw(
+                battery_mV, solar_mA, (battery_mA & 0xFFFFFF).to_bytes(3, "big")
+            )
+        if frame_type == 1:
+            return LIVE_SOLAR_CHARGER.pack_raw(8000, 100, 2000, 300, 0 if solar_mA else 1, 1850)
+        if frame_type == 2:
+            return LIVE_BATTERY_COMP_1.pack_raw(15848, 834, 800, 110, 1616, 1584, 1354, 1250)
+        return LIVE_NO_BOOSTER.pack_raw(battery_mV // 10, 1243)
+
+    def log_payload(self):
+        day = int(self.now() // 86400)
+        entry = self.log_index % self.LOG_DAYS
+        self.log_index += 1
+        day_counter = day - self.LOG_DAYS + 1 + entry
+        return LOG_DAYS.pack_raw(
+            12000, 9000, 12100, 13600, 240, day_counter & 0xFFFF, day & 0xFFFF,
+            200, 1500, 80, 15, 1616, 1200, 0x8000 + 2500, 0x8000 + 1500, 300, 280, 310,
+            0,
+        )
+
+
+class FrameCounter:
+    def __init__(self):
+        self.frames = 0
+
+    def callback(self, device, data):
+        self.frames += 1
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak RSS; kB on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def slope(points):
+    """
+    Least squares slope of y over x for a list of (x, y).
+    """
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+class Soak:
+    """
+    Runs the pipeline for `days` virtual days and samples memory every
+    `sample_interval` virtual seconds. After `warmup_days` (caches and
+    buffers filling up), memory growth must stay below `max_bytes_per_frame`
+    per processed frame and below `max_bytes_per_day` per virtual day. The
+    latter catches growth that happens only once a day, with the log
+    entries of a new day, which is small per frame. The measurement has to
+    span at least one whole virtual day.
+
+    By default, the warm-up lasts until the log payload cache is full: at
+    each virtual midnight, the current day changes in all log payloads, so
+    the cache gains LOG_DAYS entries per day.
+    """
+
+    def __init__(
+        self,
+        days=6.0,
+        sample_interval=3600,
+        warmup_days=None,
+        max_bytes_per_frame=1.0,
+        max_bytes_per_day=32 * 1024,
+        history_size=1000,
+    ):
+        if warmup_days is None:
+            warmup_days = math.ceil(BCLog.CACHE_SIZE / FakeBlueBattery.LOG_DAYS)
+        self.days = days
+        self.sample_interval = sample_interval
+        self.warmup_days = warmup_days
+        self.max_bytes_per_frame = max_bytes_per_frame
+        self.max_bytes_per_day = max_bytes_per_day
+        self.history_size = history_size
+        self.samples = []  # (virtual time, frames, rss, traced)
+        self.log = logging.getLogger("soak")
+
+    async def run_pipeline(self):
+        loop = asyncio.get_running_loop()
+        epoch = time.time() // 86400 * 86400  # start at midnight UTC
+        clock = lambda: epoch + loop.time()
+        tracer.clock = clock
+
+        counter = FrameCounter()
+        callback = DerivedMetrics(counter.callback, clock=clock).callback
+        callback = History(callback, self.history_size, clock=clock).callback
+        device = SimpleNamespace(address="00:00:00:00:00:00", name="BlueBattery_soak")
+        output_callback = lambda data: callback(device, data)
+
+        client = FakeBlueBattery(loop, epoch)
+        scheduler = GATTScheduler(client, self.log, output_callback, clock=loop.time)
+        characteristics = []
+        for c in (BCSec, BCLive, BCLog):
+            characteristic = c(scheduler.client_for(c.PRIORITY, c.SLACK), self.log, output_callback)
+            if isinstance(characteristic, BCLive):
+                characteristic.polling.clock = loop.time
+            characteristics.append(characteristic)
+
+        try:
+            end = self.days * 86400
+            while loop.time() < end:
+                await asyncio.sleep(self.sample_interval)
+                self.sample(loop.time(), counter.frames)
+                for c in characteristics:
+                    if c.task.done():
+                        raise SoakFailure(f"Read task of {c.UUID} stopped")
+        finally:
+            for c in characteristics:
+                c.task.cancel()
+            scheduler.task.cancel()
+            await asyncio.gather(
+                scheduler.task, *[c.task for c in characteristics], return_exceptions=True
+            )
+
+    def sample(self, virtual_time, frames):
+        traced, _ = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        self.samples.append((virtual_time, frames, rss, traced))
+        self.log.info(
+            f"day {virtual_time / 86400:6.2f}: {frames} frames, "
+            f"RSS {rss / 1024:.0f} KiB, traced {traced / 1024:.0f} KiB"
+        )
+
+    def run(self):
+        tracemalloc.start()
+        loop = VirtualClockEventLoop()
+        started = time.perf_counter()
+        try:
+            loop.run_until_complete(self.run_pipeline())
+        finally:
+            loop.close()
+            tracemalloc.stop()
+        self.log.info(
+            f"Simulated {self.days} days in {time.perf_counter() - started:.1f}s"
+        )
+        return self.check()
+
+    def check(self):
+        steady = [sample for sample in self.samples if sample[0] >= self.warmup_days * 86400]
+        if len(steady) < 3 or steady[-1][0] - steady[0][0] < 86400:
+            raise SoakFailure(
+                f"Less than a day measured after the warm-up of {self.warmup_days} days, run longer"
+            )
+        traced_per_frame = slope([(frames, traced) for _, frames, _, traced in steady])
+        traced_per_day = slope([(t, traced) for t, _, _, traced in steady]) * 86400
+        rss_per_frame = slope([(frames, rss) for _, frames, rss, _ in steady])
+        result = {
+            "frames": self.samples[-1][1],
+            "traced_bytes_per_frame": traced_per_frame,
+            "traced_bytes_per_day": traced_per_day,
+            "rss_bytes_per_frame": rss_per_frame,
+        }
+        self.log.info(f"Memory growth: {result}")
+        if traced_per_frame > self.max_bytes_per_frame:
+            raise SoakFailure(
+                f"Memory grows by {traced_per_frame:.3f} bytes per frame "
+                f"(limit {self.max_bytes_per_frame})"
+            )
+        if traced_per_day > self.max_bytes_per_day:
+            raise SoakFailure(
+                f"Memory grows by {traced_per_day:.0f} bytes per day "
+                f"(limit {self.max_bytes_per_day})"
+            )
+        return result
+
+
+def run():
+    parser = argparse.ArgumentParser(description="BlueBattery soak test")
+    parser.add_argument("--days", type=float, default=6.0, help="Virtual days to run (default: 6)")
+    parser.add_argument(
+        "--warmup-days",
+        type=float,
+        default=None,
+        help="Virtual days before memory growth is measured (default: until the log payload cache is full)",
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=3600,
+        help="Virtual seconds between memory samples (default: 3600)",
+    )
+    parser.add_argument(
+        "--max-bytes-per-frame",
+        type=float,
+        default=1.0,
+        help="Maximum allowed traced memory growth per frame after warm-up (default: 1.0)",
+    )
+    parser.add_argument(
+        "--max-bytes-per-day",
+        type=float,
+        default=32 * 1024,
+        help="Maximum allowed traced memory growth per virtual day after warm-up (default: 32768)",
+    )
+    parser.add_argument(
+        "--history-size",
+        type=int,
+        default=1000,
+        help="Size of the history ring buffers in the pipeline (default: 1000)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    soak = Soak(
+        days=args.days,
+        sample_interval=args.sample_interval,
+        warmup_days=args.warmup_days,
+        max_bytes_per_frame=args.max_bytes_per_frame,
+        max_bytes_per_day=args.max_bytes_per_day,
+        history_size=args.history_size,
+    )
+    try:
+        soak.run()
+    except SoakFailure as e:
+        logging.getLogger("soak").error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
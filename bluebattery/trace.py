@@ -0,0 +1,133 @@
+"""
+Low-overhead tracing of the raw payloads read from the device.
+
+Every read is recorded in a preallocated binary ring buffer (no string
+formatting). Debug log messages for raw payloads and parsed frames are only
+emitted for a sample of the reads (every Nth read, at most a given number per
+second) and are formatted lazily by the logging module. The ring buffer can
+be dumped to the log on demand, e.g., on SIGUSR1.
+"""
+
+import logging
+import struct
+import time
+
+
+class Hex:
+    """
+    Formats bytes as hex only when converted to a string, i.e., only when
+    the log message is actually emitted.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return " ".join(f"{b:02x}" for b in self.data)
+
+
+class Tracer:
+    # record: timestamp, event id, payload length, payload (truncated)
+    HEADER = struct.Struct(">dBB")
+    PAYLOAD_SIZE = 54
+    RECORD_SIZE = HEADER.size + PAYLOAD_SIZE
+
+    def __init__(self, records=4096, sample_every=100, max_per_second=1.0, clock=time.time):
+        self.configure(records, sample_every, max_per_second)
+        self.clock = clock
+        self.events = {}
+        self.log = logging.getLogger("trace")
+
+    def configure(self, records=None, sample_every=None, max_per_second=None):
+        if records is not None:
+            self.records = records
+            self.buffer = bytearray(records * self.RECORD_SIZE)
+            self.position = 0
+            self.count = 0
+        if sample_every is not None:
+            self.sample_every = sample_every
+        if max_per_second is not None:
+            self.max_per_second = max_per_second
+        self.reads = 0
+        self.last_sample = None
+
+    def event_id(self, name):
+        if name not in self.events:
+            self.events[name] = len(self.events)
+        return self.events[name]
+
+    def record(self, event, payload=b""):
+        """
+        Stores an event in the ring buffer. `event` is a name (see event_id).
+        Does nothing if the ring buffer has no records.
+        """
+        if not self.records:
+            return
+        offset = self.position * self.RECORD_SIZE
+        payload = payload[: self.PAYLOAD_SIZE]
+        self.HEADER.pack_into(
+            self.buffer, offset, self.clock(), self.event_id(event), len(payload)
+        )
+        start = offset + self.HEADER.size
+        self.buffer[start : start + len(payload)] = payload
+        self.position = (self.position + 1) % self.records
+        self.count = min(self.count + 1, self.records)
+
+    def sample(self):
+        """
+        Returns True for every `sample_every`th call, but at most
+        `max_per_second` times per second (no limit if it is 0 or less).
+        """
+        self.reads += 1
+        if self.sample_every > 1 and self.reads % self.sample_every:
+            return False
+        now = self.clock()
+        if (
+            self.max_per_second > 0
+            and self.last_sample is not None
+            and now - self.last_sample < 1 / self.max_per_second
+        ):
+            return False
+        self.last_sample = now
+        return True
+
+    def raw(self, log, name, data):
+        """
+        Records a raw payload read from characteristic `name`. Returns True
+        if this read was sampled for debug logging; the caller may then log
+        more details about the read.
+        """
+        self.record(name, data)
+        if log.isEnabledFor(logging.DEBUG) and self.sample():
+            log.debug("Read %s: %s", name, Hex(data))
+            return True
+        return False
+
+    def entries(self):
+        """
+        Yields (timestamp, event name, payload) for all records, oldest first.
+        """
+        if not self.records:
+            return
+        names = {event_id: name for name, event_id in self.events.items()}
+        first = (self.position - self.count) % self.records
+        for i in range(self.count):
+            offset = ((first + i) % self.records) * self.RECORD_SIZE
+            timestamp, event_id, length = self.HEADER.unpack_from(self.buffer, offset)
+            start = offset + self.HEADER.size
+            yield timestamp, names[event_id], bytes(self.buffer[start : start + length])
+
+    def dump(self, *_):
+        """
+        Writes all records to the log. Can be used as a signal handler of
+        the event loop (loop.add_signal_handler); as a plain signal handler,
+        it could run while a record is half written.
+        """
+        self.log.info(f"Dumping {self.count} trace records")
+        for timestamp, name, payload in self.entries():
+            self.log.info("%.3f %s %s", timestamp, name, Hex(payload))
+
+
+tracer = Tracer()
@@ -0,0 +1,144 @@
+"""
+Compact binary uplink format for raw payloads, and the matching decoder.
+
+Instead of one text message per field, the raw payloads read from the
+device are sent in batches:
+
+    batch    := version:u8 flags:u8 base_time_ms:u64 envelope*
+    envelope := schema:u8 delta_ms:varint length:u8 payload
+
+`flags` bit 0 indicates that everything after the header is zlib
+compressed. `delta_ms` is the time since the previous envelope in the batch
+(the first one is relative to `base_time_ms`). The schema id selects the
+characteristic and therefore the frame types used to decode the payload.
+
+This module only depends on the frame type definitions, so it can be used
+on the receiving side to turn batches back into (output_id, values):
+
+    decoder = UplinkDecoder()
+    for timestamp, output_id, values in decoder.decode(batch):
+        ...
+"""
+
+import struct
+import zlib
+
+from . import frametypes
+
+VERSION = 1
+FLAG_COMPRESSED = 0x01
+HEADER = struct.Struct(">BBQ")
+
+# schema id: (characteristic UUID, frame types)
+SCHEMAS = {
+    1: ("4b616901-40bd-428b-bf06-698e5e422cd9", frametypes.SecFrame),
+    2: ("4b616912-40bd-428b-bf06-698e5e422cd9", frametypes.LiveFrameTypes),
+    3: ("4b616907-40bd-428b-bf06-698e5e422cd9", frametypes.LogFrameTypes),
+}
+SCHEMA_IDS = {uuid: schema for schema, (uuid, _) in SCHEMAS.items()}
+
+
+class UplinkError(Exception):
+    pass
+
+
+def encode_varint(value):
+    output = bytearray()
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+    return bytes(output)
+
+
+def decode_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+class UplinkEncoder:
+    """
+    Collects raw payloads of one device into a batch.
+    """
+
+    def __init__(self, compress=False):
+        self.compress = compress
+        self.reset()
+
+    def reset(self):
+        self.body = bytearray()
+        self.count = 0
+        self.base_time_ms = None
+        self.last_time_ms = None
+
+    def add(self, uuid, payload, timestamp):
+        if uuid not in SCHEMA_IDS:
+            raise UplinkError(f"No schema for characteristic {uuid}")
+        time_ms = int(timestamp * 1000)
+        if self.base_time_ms is None:
+            self.base_time_ms = self.last_time_ms = time_ms
+        delta_ms = max(0, time_ms - self.last_time_ms)
+        self.last_time_ms += delta_ms
+        self.body += bytes([SCHEMA_IDS[uuid]]) + encode_varint(delta_ms)
+        self.body += bytes([len(payload)]) + payload
+        self.count += 1
+
+    def flush(self):
+        """
+        Returns the batch and starts a new one. Returns None if the batch is empty.
+        """
+        if not self.count:
+            return None
+        body = bytes(self.body)
+        flags = 0
+        if self.compress:
+            compressed = zlib.compress(body, 9)
+            if len(compressed) < len(body):
+                body = compressed
+                flags |= FLAG_COMPRESSED
+        batch = HEADER.pack(VERSION, flags, self.base_time_ms) + body
+        self.reset()
+        return batch
+
+
+class UplinkDecoder:
+    """
+    Decodes batches of one device. The decoder keeps state between batches,
+    like a characteristic does between reads (e.g., the current day for log
+    entries), so use one decoder per device.
+    """
+
+    def __init__(self):
+        self.max_days_observed = None
+
+    def decode(self, batch):
+        """
+        Yields (timestamp, output_id, values) for all frames in the batch.
+        """
+        version, flags, time_ms = HEADER.unpack_from(batch)
+        if version != VERSION:
+            raise UplinkError(f"Unsupported version {version}")
+        body = batch[HEADER.size :]
+        if flags & FLAG_COMPRESSED:
+            body = zlib.decompress(body)
+
+        offset = 0
+        while offset < len(body):
+            schema = body[offset]
+            delta_ms, offset = decode_varint(body, offset + 1)
+            length = body[offset]
+            payload = body[offset + 1 : offset + 1 + length]
+            offset += 1 + length
+            time_ms += delta_ms
+            if schema not in SCHEMAS:
+                raise UplinkError(f"Unknown schema {schema}")
+            _, frame_types = SCHEMAS[schema]
+            for _, output_id, values in frame_types.process(self, payload):
+                yield time_ms / 1000, output_id, values